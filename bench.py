@@ -0,0 +1,93 @@
+# bench.py
+# Micro-benchmarks for the hot paths in bot.py.
+#   python bench.py sessions [--max-users 1000000] [--backend sqlite|json]
+#   python bench.py highlighter [--messages 100000]   (exits non-zero if bench_golden.json drifts)
+#   python -m pytest bench.py                          (golden checks only, for CI)
+
+import argparse
+import json
+import os
+import sys
+import statistics
+import tempfile
+import time
+
+import bot
+
+SAMPLE_SESSION = {'sid': 'AC' + '0' * 32, 'auth': 'x' * 32, 'number': '+14165550123'}
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def _timed(run) -> float:
+    started = time.perf_counter()
+    run()
+    return time.perf_counter() - started
+
+def _prefill(store, user_count: int, chunk: int = 50_000):
+    row = json.dumps(SAMPLE_SESSION)
+    for first in range(0, user_count, chunk):
+        store.apply({uid: row for uid in range(first, min(first + chunk, user_count))})
+
+def bench_sessions(max_users: int, backend: str, writes: int = 1000):
+    sizes = [n for n in (1_000, 10_000, 100_000, 1_000_000) if n <= max_users]
+    print(f"session store: {backend} backend, {writes} single-user upserts per size")
+    print(f"{'users':>10} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for user_count in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            if backend == 'json': store = bot.JsonSessionStore(os.path.join(tmp, 'sessions.json'))
+            else: store = bot.SqliteSessionStore(os.path.join(tmp, 'sessions.db'))
+            _prefill(store, user_count)
+            samples = []
+            for i in range(writes):
+                uid = (i * 7919) % user_count
+                row = json.dumps({**SAMPLE_SESSION, 'number': f"+1416555{i % 10000:04d}"})
+                started = time.perf_counter()
+                store.apply({uid: row})
+                samples.append((time.perf_counter() - started) * 1000)
+            store.close()
+        print(f"{user_count:>10} {_percentile(samples, 50):>9.3f} {_percentile(samples, 99):>9.3f} {statistics.mean(samples):>9.3f}")
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_golden.json')
+
+def check_highlighter_golden() -> int:
+    with open(GOLDEN_FILE, 'r') as f:
+        golden = json.load(f)
+    failures = 0
+    for case in golden:
+        got = bot.format_codes_in_message(case['body'])
+        if got != case['expected']:
+            failures += 1
+            print(f"MISMATCH {case['body']!r}\n  expected {case['expected']!r}\n       got {got!r}")
+    if [c['expected'] for c in golden] != bot.format_codes_in_messages([c['body'] for c in golden]):
+        failures += 1
+        print("MISMATCH format_codes_in_messages differs from format_codes_in_message")
+    print(f"golden corpus: {len(golden) - failures}/{len(golden)} ok")
+    return failures
+
+def test_highlighter_golden():
+    assert check_highlighter_golden() == 0
+
+def bench_highlighter(message_count: int, rounds: int = 5):
+    if check_highlighter_golden(): sys.exit(1)
+    with open(GOLDEN_FILE, 'r') as f:
+        corpus = [case['body'] for case in json.load(f)]
+    history = [corpus[i % len(corpus)] for i in range(message_count)]
+    total_chars = sum(len(body) for body in history)
+    for label, run in (("single", lambda: [bot.format_codes_in_message(body) for body in history]), ("batch", lambda: bot.format_codes_in_messages(history))):
+        best = min(_timed(run) for _ in range(rounds))
+        print(f"{label:>7}: {message_count} messages in {best * 1000:.1f} ms -> {message_count / best:,.0f} msg/s, {total_chars / best / 1e6:.1f} Mchar/s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="bot.py micro-benchmarks")
+    sub = parser.add_subparsers(dest='suite', required=True)
+    sessions = sub.add_parser('sessions', help="per-user upsert latency vs. stored users")
+    sessions.add_argument('--max-users', type=int, default=1_000_000)
+    sessions.add_argument('--backend', choices=['sqlite', 'json'], default='sqlite')
+    sessions.add_argument('--writes', type=int, default=1000)
+    highlighter = sub.add_parser('highlighter', help="OTP highlighter throughput on a large message history")
+    highlighter.add_argument('--messages', type=int, default=100_000)
+    args = parser.parse_args()
+    if args.suite == 'sessions': bench_sessions(args.max_users, args.backend, args.writes)
+    elif args.suite == 'highlighter': bench_highlighter(args.messages)
@@ -2,15 +2,36 @@
 
 import logging
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.error import BadRequest
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+from telegram.request import HTTPXRequest
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler, CallbackQueryHandler, ChatMemberHandler
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from twilio.request_validator import RequestValidator
+from twilio.base.exceptions import TwilioRestException
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectTimeout, RequestException
 import os
 import threading
-from flask import Flask
+from flask import Flask, request
+from aiohttp import web
+import random
+import secrets
 import re
+import hmac
 import json
-from functools import wraps
+import asyncio
+import itertools
+import signal
+import sqlite3
+import weakref
+import time
+import uuid
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import wraps, partial
 
 # Enable logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
@@ -22,74 +43,590 @@ FORCE_SUB_CHANNEL_ID = -1002085020447
 FORCE_SUB_CHANNEL_LINK = "https://t.me/+-HQpmwwkFaRhNmI1" # আপনার নতুন চ্যানেল লিংক
 
 
+# --- Metrics (Prometheus text format, served at /metrics) ---
+# Recording is a couple of dict/int updates on the event loop, cheap enough to leave on in production.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+class Histogram:
+    __slots__ = ('buckets', 'total', 'count')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total, self.count = 0.0, 0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+class Metrics:
+    def __init__(self):
+        self.handler_latency: dict[str, Histogram] = defaultdict(Histogram)
+        self.upstream_latency: dict[tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.errors: Counter = Counter()
+        self.in_flight = 0
+        self.caches: dict = {}
+        self.gauges: dict = {}
+
+    def count_error(self, scope: str, name: str, error):
+        self.errors[(scope, name, error if isinstance(error, str) else type(error).__name__)] += 1
+
+    def register_cache(self, name: str, cache):
+        self.caches[name] = cache
+
+    def register_gauges(self, prefix: str, collect):
+        self.gauges[prefix] = collect
+
+    def render(self) -> str:
+        lines = []
+        def histogram(name: str, help_text: str, series: list):
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} histogram"])
+            for labels, hist in series:
+                cumulative = 0
+                for bound, bucket in zip(LATENCY_BUCKETS + ('+Inf',), hist.buckets):
+                    cumulative += bucket
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {hist.total}")
+                lines.append(f"{name}_count{{{labels}}} {hist.count}")
+        histogram('bot_handler_latency_seconds', "Handler latency.", [(f'handler="{name}"', h) for name, h in list(self.handler_latency.items())])
+        histogram('bot_upstream_latency_seconds', "Twilio and Telegram API call latency.", [(f'service="{service}",operation="{op}"', h) for (service, op), h in list(self.upstream_latency.items())])
+        lines.extend(["# HELP bot_errors_total Errors by scope and exception type.", "# TYPE bot_errors_total counter"])
+        lines.extend(f'bot_errors_total{{scope="{scope}",name="{name}",exception="{exc}"}} {count}' for (scope, name, exc), count in list(self.errors.items()))
+        lines.extend(["# HELP bot_updates_in_flight Updates currently being handled.", "# TYPE bot_updates_in_flight gauge", f"bot_updates_in_flight {self.in_flight}"])
+        cache_stats = [(name, cache.stats()) for name, cache in list(self.caches.items())]
+        for field, kind in (('hits', 'counter'), ('misses', 'counter'), ('size', 'gauge')):
+            metric = f"bot_cache_{field}_total" if kind == 'counter' else f"bot_cache_{field}"
+            lines.extend([f"# HELP {metric} Cache {field}.", f"# TYPE {metric} {kind}"])
+            lines.extend(f'{metric}{{cache="{name}"}} {stats[field]}' for name, stats in cache_stats)
+        for prefix, collect in list(self.gauges.items()):
+            for key, value in collect().items():
+                lines.extend([f"# TYPE bot_{prefix}_{key} gauge", f"bot_{prefix}_{key} {value}"])
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def instrumented(func):
+    name = func.__name__
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            metrics.count_error('handler', name, e)
+            raise
+        finally:
+            metrics.in_flight -= 1
+            metrics.handler_latency[name].observe(time.perf_counter() - started)
+    return wrapper
+
+def instrument_handlers(application: Application):
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                nested = handler.entry_points + [h for state in handler.states.values() for h in state] + handler.fallbacks
+            else:
+                nested = [handler]
+            for h in nested: h.callback = instrumented(h.callback)
+
+class InstrumentedRequest(HTTPXRequest):
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        operation = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as e:
+            metrics.count_error('telegram', operation, e)
+            raise
+        finally:
+            metrics.upstream_latency[('telegram', operation)].observe(time.perf_counter() - started)
+        if code >= 400: metrics.count_error('telegram', operation, f"HTTP{code}")
+        return code, payload
+
 # --- Globals & Persistence ---
+# user_sessions is the in-memory working set; changes are marked with save_session(user_id) and flushed
+# to the session store in the background, so one write costs O(changed users) instead of O(all users).
 user_sessions = {} 
 SESSIONS_FILE = 'sessions.json'
+SESSIONS_DB = os.environ.get('SESSIONS_DB', 'sessions.db')
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')  # 'sqlite' or 'json'
+SESSION_FLUSH_INTERVAL = float(os.environ.get('SESSION_FLUSH_INTERVAL', 2))
+TRANSIENT_SESSION_KEYS = {'client'}
+_dirty_sessions: set[int] = set()
+session_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sessions')
+background_tasks: list[asyncio.Task] = []
 
-def save_sessions():
-    with open(SESSIONS_FILE, 'w') as f:
-        sessions_to_save = {}
-        for uid, data in user_sessions.items():
-            sessions_to_save[uid] = {k: v for k, v in data.items() if k != 'client'}
-        json.dump(sessions_to_save, f, indent=4)
-    logger.info("User sessions saved to file.")
+def atomic_write_json(path: str, payload) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
 
-def load_sessions():
-    global user_sessions
-    if os.path.exists(SESSIONS_FILE):
+class JsonSessionStore:
+    # Legacy single-file backend: every flush rewrites the whole file, but atomically.
+    def __init__(self, path: str):
+        self.path = path
+        self._rows: dict[int, str] = {}
+
+    def load_all(self) -> dict[int, dict]:
+        if not os.path.exists(self.path): return {}
+        with open(self.path, 'r') as f:
+            sessions = {int(uid): data for uid, data in json.load(f).items()}
+        self._rows = {uid: json.dumps(data) for uid, data in sessions.items()}
+        return sessions
+
+    def apply(self, changes: dict[int, str | None]) -> None:
+        for uid, row in changes.items():
+            if row is None: self._rows.pop(uid, None)
+            else: self._rows[uid] = row
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("{" + ", ".join(f'"{uid}": {row}' for uid, row in self._rows.items()) + "}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def close(self) -> None: pass
+
+class SqliteSessionStore:
+    # One row per user in WAL mode: a flush is a single transaction of per-user upserts/deletes.
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sessions (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        self.conn.commit()
+
+    def load_all(self) -> dict[int, dict]:
+        return {int(uid): json.loads(data) for uid, data in self.conn.execute("SELECT user_id, data FROM sessions")}
+
+    def apply(self, changes: dict[int, str | None]) -> None:
+        upserts = [(uid, row) for uid, row in changes.items() if row is not None]
+        deletes = [(uid,) for uid, row in changes.items() if row is None]
+        with self.conn:
+            if upserts: self.conn.executemany("INSERT INTO sessions (user_id, data) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET data = excluded.data", upserts)
+            if deletes: self.conn.executemany("DELETE FROM sessions WHERE user_id = ?", deletes)
+
+    def close(self) -> None: self.conn.close()
+
+def create_session_store():
+    if SESSION_BACKEND == 'json': return JsonSessionStore(SESSIONS_FILE)
+    store = SqliteSessionStore(SESSIONS_DB)
+    if os.path.exists(SESSIONS_FILE) and not store.load_all():
         try:
-            with open(SESSIONS_FILE, 'r') as f:
-                user_sessions = json.load(f)
-            logger.info(f"Successfully loaded {len(user_sessions)} user sessions from {SESSIONS_FILE}.")
-        except (json.JSONDecodeError, IOError) as e:
-            logger.error(f"Could not load sessions from {SESSIONS_FILE}: {e}")
-            user_sessions = {}
-    else:
-        logger.info(f"{SESSIONS_FILE} not found. Starting with empty sessions.")
-        user_sessions = {}
-
-def get_twilio_client(user_id: int) -> Client | None:
-    if user_id not in user_sessions: return None
-    if 'client' in user_sessions[user_id] and isinstance(user_sessions[user_id]['client'], Client):
-        return user_sessions[user_id]['client']
-    sid, auth = user_sessions[user_id].get('sid'), user_sessions[user_id].get('auth')
-    if sid and auth:
+            legacy = JsonSessionStore(SESSIONS_FILE).load_all()
+            store.apply({uid: json.dumps(data) for uid, data in legacy.items()})
+            os.replace(SESSIONS_FILE, f"{SESSIONS_FILE}.migrated")
+            logger.info(f"Migrated {len(legacy)} user sessions from {SESSIONS_FILE} to {SESSIONS_DB}.")
+        except (json.JSONDecodeError, IOError, ValueError) as e:
+            logger.error(f"Could not migrate sessions from {SESSIONS_FILE}: {e}")
+    return store
+
+session_store = None
+
+def save_session(user_id: int):
+    _dirty_sessions.add(user_id)
+
+def _collect_dirty_sessions() -> dict[int, str | None]:
+    changes = {}
+    for uid in _dirty_sessions:
+        data = user_sessions.get(uid)
+        changes[uid] = None if data is None else json.dumps({k: v for k, v in data.items() if k not in TRANSIENT_SESSION_KEYS})
+    _dirty_sessions.clear()
+    return changes
+
+async def flush_sessions():
+    if not _dirty_sessions or session_store is None: return
+    changes = _collect_dirty_sessions()
+    try:
+        await asyncio.get_running_loop().run_in_executor(session_executor, session_store.apply, changes)
+    except Exception as e:
+        logger.error(f"Failed to flush {len(changes)} sessions: {e}")
+        _dirty_sessions.update(changes)
+
+async def session_flusher():
+    while True:
+        await asyncio.sleep(SESSION_FLUSH_INTERVAL)
+        await flush_sessions()
+
+def load_sessions():
+    global session_store
+    user_sessions.clear()
+    try:
+        session_store = create_session_store()
+        user_sessions.update(session_store.load_all())
+        number_inventory.rebuild()
+        logger.info(f"Successfully loaded {len(user_sessions)} user sessions ({SESSION_BACKEND} backend).")
+    except (json.JSONDecodeError, IOError, ValueError, sqlite3.Error) as e:
+        # Running without a working store would silently drop every later login, purchase and release.
+        logger.critical(f"FATAL: Could not load sessions ({SESSION_BACKEND} backend): {e}")
+        exit(1)
+
+def close_sessions():
+    # The final write and close run on session_executor (one thread), so they queue behind a flush that on_shutdown
+    # cancelled while its apply() was still using the store's connection.
+    if session_store is None: return
+    changes = _collect_dirty_sessions() if _dirty_sessions else {}
+    def finish():
+        if changes: session_store.apply(changes)
+        session_store.close()
+    session_executor.submit(finish).result()
+
+# --- Twilio calls off the event loop ---
+# twilio.rest.Client is synchronous, so every REST call runs on a bounded worker pool with a per-call timeout.
+TWILIO_MAX_WORKERS = int(os.environ.get('TWILIO_MAX_WORKERS', 32))
+TWILIO_CALL_TIMEOUT = float(os.environ.get('TWILIO_CALL_TIMEOUT', 20))
+CONCURRENT_UPDATES = int(os.environ.get('CONCURRENT_UPDATES', 64))
+TELEGRAM_POOL_SIZE = int(os.environ.get('TELEGRAM_POOL_SIZE', 256))
+twilio_executor = ThreadPoolExecutor(max_workers=TWILIO_MAX_WORKERS, thread_name_prefix='twilio')
+
+async def twilio_call(func, *args, timeout: float | None = None, **kwargs):
+    operation = f"{type(getattr(func, '__self__', func)).__name__}.{getattr(func, '__name__', 'call')}"
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(twilio_executor, partial(func, *args, **kwargs))
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(future, timeout or TWILIO_CALL_TIMEOUT)
+    except Exception as e:
+        metrics.count_error('twilio', operation, e)
+        raise
+    finally:
+        metrics.upstream_latency[('twilio', operation)].observe(time.perf_counter() - started)
+
+# --- Caching helpers ---
+class SingleFlight:
+    # Concurrent callers with the same key share one in-flight coroutine instead of repeating the work.
+    def __init__(self):
+        self._inflight: dict = {}
+
+    async def run(self, key, factory):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _, key=key: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+class TTLCache:
+    # Small LRU map with per-entry expiry; hits/misses feed the stats reports.
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None: del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, ttl: float | None = None):
+        self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def values(self) -> list:
+        now = time.monotonic()
+        return [value for value, expires in self._data.values() if expires > now]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+# --- Twilio client registry ---
+# All accounts share one pooled HTTP transport; resident clients are capped by LRU size and idle time,
+# and credentials validated within TWILIO_VALIDATION_WINDOW are not re-fetched (also across restarts).
+TWILIO_CLIENT_CACHE_SIZE = int(os.environ.get('TWILIO_CLIENT_CACHE_SIZE', 1000))
+TWILIO_CLIENT_IDLE_TTL = float(os.environ.get('TWILIO_CLIENT_IDLE_TTL', 1800))
+TWILIO_VALIDATION_WINDOW = float(os.environ.get('TWILIO_VALIDATION_WINDOW', 86400))
+TWILIO_POOL_MAXSIZE = int(os.environ.get('TWILIO_POOL_MAXSIZE', TWILIO_MAX_WORKERS))
+
+class PooledTwilioHttpClient(TwilioHttpClient):
+    def __init__(self, pool_maxsize: int, timeout: float):
+        super().__init__(pool_connections=True, timeout=timeout)
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', self.adapter)
+
+    def pool_stats(self) -> dict:
+        pools = self.adapter.poolmanager.pools
+        connections = requests_sent = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None: continue
+            connections += pool.num_connections
+            requests_sent += pool.num_requests
+        return {'pools': len(pools), 'connections_opened': connections, 'requests': requests_sent, 'reuse_rate': 1 - connections / requests_sent if requests_sent else 0.0}
+
+class TwilioClientRegistry:
+    def __init__(self, maxsize: int, idle_ttl: float, validation_window: float):
+        self.http_client = PooledTwilioHttpClient(TWILIO_POOL_MAXSIZE, TWILIO_CALL_TIMEOUT)
+        self.validation_window = validation_window
+        self._clients = TTLCache(maxsize, idle_ttl)
+
+    def client_for(self, sid: str, auth: str) -> Client:
+        return Client(sid, auth, http_client=self.http_client)
+
+    def remember(self, user_id: int, sid: str, auth: str, client: Client):
+        self._clients.set(user_id, (sid, auth, client))
+
+    def discard(self, user_id: int):
+        self._clients.pop(user_id)
+
+    async def get(self, user_id: int) -> Client | None:
+        session = user_sessions.get(user_id)
+        if not session: return None
+        sid, auth = session.get('sid'), session.get('auth')
+        if not (sid and auth): return None
+        entry = self._clients.get(user_id)
+        if entry and entry[:2] == (sid, auth):
+            self.remember(user_id, sid, auth, entry[2])
+            return entry[2]
+        client = self.client_for(sid, auth)
+        if time.time() - session.get('validated_at', 0) > self.validation_window:
+            try:
+                await twilio_call(client.api.accounts(sid).fetch)
+            except Exception as e:
+                logger.error(f"Failed to create Twilio client for user {user_id} on demand: {e}")
+                return None
+            session['validated_at'] = time.time()
+            save_session(user_id)
+        self.remember(user_id, sid, auth, client)
+        return client
+
+    def any_client(self) -> Client | None:
+        clients = self._clients.values()
+        return clients[-1][2] if clients else None
+
+    def stats(self) -> dict:
+        return {'clients': self._clients.stats(), 'http_pool': self.http_client.pool_stats()}
+
+twilio_clients = TwilioClientRegistry(TWILIO_CLIENT_CACHE_SIZE, TWILIO_CLIENT_IDLE_TTL, TWILIO_VALIDATION_WINDOW)
+metrics.register_cache('twilio_clients', twilio_clients._clients)
+metrics.register_gauges('twilio_http', twilio_clients.http_client.pool_stats)
+
+async def get_twilio_client(user_id: int) -> Client | None:
+    return await twilio_clients.get(user_id)
+
+# --- Available-number search cache ---
+# Available inventory is global, so results are shared across users per (country, area code) for a short TTL,
+# concurrent identical searches share one request, and bought numbers are dropped from cached results.
+NUMBER_SEARCH_TTL = float(os.environ.get('NUMBER_SEARCH_TTL', 60))
+NUMBER_SEARCH_LIMIT = 10
+NUMBER_WARMER_INTERVAL = float(os.environ.get('NUMBER_WARMER_INTERVAL', 0))  # 0 disables the warmer
+NUMBER_WARMER_TOP = int(os.environ.get('NUMBER_WARMER_TOP', 5))
+
+class NumberSearchCache:
+    def __init__(self, ttl: float, maxsize: int = 512):
+        self._results = TTLCache(maxsize, ttl)
+        self._flights = SingleFlight()
+        self.search_counts: Counter = Counter()
+
+    async def search(self, client: Client, country: str, area_code: str, force: bool = False) -> list:
+        key = (country, area_code)
+        if not force:
+            self.search_counts[key] += 1
+            cached = self._results.get(key)
+            if cached is not None: return list(cached)
+        return list(await self._flights.run(key, partial(self._fetch, client, country, area_code)))
+
+    async def _fetch(self, client: Client, country: str, area_code: str) -> list:
+        search_filters = {'area_code': area_code} if area_code else {}
+        numbers = await twilio_call(client.available_phone_numbers(country).local.list, limit=NUMBER_SEARCH_LIMIT, **search_filters)
+        numbers = list(numbers)
+        self._results.set((country, area_code), numbers)
+        return numbers
+
+    def evict_number(self, phone_number: str):
+        for numbers in self._results.values():
+            numbers[:] = [n for n in numbers if n.phone_number != phone_number]
+
+    def hottest(self, count: int) -> list[tuple[str, str]]:
+        return [key for key, _ in self.search_counts.most_common(count)]
+
+    def decay(self):
+        self.search_counts = Counter({key: hits // 2 for key, hits in self.search_counts.items() if hits > 1})
+
+number_search_cache = NumberSearchCache(NUMBER_SEARCH_TTL)
+metrics.register_cache('number_search', number_search_cache._results)
+
+async def number_search_warmer():
+    # Re-fetches the hottest area codes before they expire so the buy flow answers from memory.
+    while True:
+        await asyncio.sleep(NUMBER_WARMER_INTERVAL)
+        client = twilio_clients.any_client()
+        if client is None: continue
+        for country, area_code in number_search_cache.hottest(NUMBER_WARMER_TOP):
+            try:
+                await number_search_cache.search(client, country, area_code, force=True)
+            except Exception as e:
+                logger.warning(f"Warming number search {country}/{area_code} failed: {e}")
+        number_search_cache.decay()
+
+# --- Multi-area-code / multi-country search ---
+# The buy prompt accepts "416, 647", a region name ("toronto") or a country selector ("US:212", "US").
+# Searches fan out under SEARCH_CONCURRENCY, each bounded by SEARCH_TIMEOUT, and results stream out as they land.
+SEARCH_CONCURRENCY = int(os.environ.get('SEARCH_CONCURRENCY', 4))
+SEARCH_TIMEOUT = float(os.environ.get('SEARCH_TIMEOUT', 15))
+MAX_SEARCH_TARGETS = 10
+NUMBER_REGIONS = {
+    'toronto': [('CA', '416'), ('CA', '647'), ('CA', '437')],
+    'gta': [('CA', '416'), ('CA', '647'), ('CA', '437'), ('CA', '905'), ('CA', '289'), ('CA', '365')],
+    'ottawa': [('CA', '613'), ('CA', '343')],
+    'montreal': [('CA', '514'), ('CA', '438')],
+    'quebec': [('CA', '418'), ('CA', '581'), ('CA', '514'), ('CA', '438'), ('CA', '450'), ('CA', '819')],
+    'vancouver': [('CA', '604'), ('CA', '778'), ('CA', '236')],
+    'bc': [('CA', '604'), ('CA', '778'), ('CA', '236'), ('CA', '250')],
+    'alberta': [('CA', '403'), ('CA', '587'), ('CA', '780'), ('CA', '825')],
+    'manitoba': [('CA', '204'), ('CA', '431')],
+}
+SEARCH_TARGET_PATTERN = re.compile(r'^(?:(?P<country>[A-Za-z]{2})[:\-]?)?(?P<area_code>\d{3})?$')
+
+def parse_search_targets(text: str) -> list[tuple[str, str]] | None:
+    targets = []
+    for token in re.split(r'[\s,;]+', text.strip()):
+        if not token: continue
+        if token.lower() in NUMBER_REGIONS:
+            targets.extend(NUMBER_REGIONS[token.lower()])
+            continue
+        match = SEARCH_TARGET_PATTERN.match(token)
+        if not match or not (match['country'] or match['area_code']): return None
+        targets.append(((match['country'] or 'CA').upper(), match['area_code'] or ''))
+    targets = list(dict.fromkeys(targets))
+    return targets[:MAX_SEARCH_TARGETS] if targets else None
+
+def search_targets_help() -> str:
+    return (f"📝 কোথায় নম্বর খুঁজবেন লিখুন (সর্বোচ্চ {MAX_SEARCH_TARGETS}টি, কমা বা স্পেস দিয়ে আলাদা করুন):\n"
+            "• কানাডার এরিয়া কোড: 416 বা 416, 647\n"
+            "• অন্য দেশের এরিয়া কোড: US:212\n"
+            "• পুরো দেশ: US বা CA\n"
+            f"• অঞ্চল: {', '.join(NUMBER_REGIONS)}")
+
+def search_target_label(country: str, area_code: str) -> str:
+    if not area_code: return f"`{country}` দেশে"
+    return f"`{area_code}` এরিয়া কোডে" if country == 'CA' else f"`{country}:{area_code}` এরিয়া কোডে"
+
+async def _search_target(client: Client, semaphore: asyncio.Semaphore, country: str, area_code: str):
+    async with semaphore:
+        return country, area_code, await asyncio.wait_for(number_search_cache.search(client, country, area_code), SEARCH_TIMEOUT)
+
+async def stream_number_searches(message_object, context: ContextTypes.DEFAULT_TYPE, client: Client, targets: list[tuple[str, str]]) -> tuple[int, int]:
+    semaphore = asyncio.Semaphore(SEARCH_CONCURRENCY)
+    tasks = [asyncio.ensure_future(_search_target(client, semaphore, country, area_code)) for country, area_code in targets]
+    seen, shown, failed = set(), 0, 0
+    for next_result in asyncio.as_completed(tasks):
         try:
-            client = Client(sid, auth)
-            client.api.accounts(sid).fetch()
-            user_sessions[user_id]['client'] = client
-            return client
+            country, area_code, numbers = await next_result
         except Exception as e:
-            logger.error(f"Failed to create Twilio client for user {user_id} on demand: {e}")
-            return None
-    return None
+            logger.error(f"Fetch numbers failed: {e!r}")
+            failed += 1
+            continue
+        fresh = [n for n in numbers if n.phone_number not in seen]
+        seen.update(n.phone_number for n in fresh)
+        if fresh:
+            await display_numbers_with_buy_buttons(message_object, context, fresh, search_target_label(country, area_code))
+            shown += len(fresh)
+    return shown, failed
+
+# --- OTP / code highlighting ---
+# One compiled alternation replaces the old per-pattern scans. Every candidate is a whole word (or G-123456),
+# so leftmost matching is exactly the old longest-match-wins overlap rule; the lookarounds keep codes that
+# already touch a backtick untouched.
+MESSAGE_SEPARATOR = '\x00'
+CODE_PATTERN = re.compile(r'(?<!`)(?:\bG-\d{6}\b|\b(?:[A-Z0-9]{6,8}|\d{4,8})\b)(?!`)')
 
 def format_codes_in_message(body: str) -> str:
     if not body: return ""
-    patterns = [r'\b(G-\d{6})\b', r'\b([A-Z0-9]{7,8})\b', r'\b([A-Z0-9]{6})\b', r'\b(\d{7,8})\b', r'\b(\d{6})\b', r'\b(\d{4,5})\b']
-    all_matches = []
-    for pattern in patterns:
-        for match in re.finditer(pattern, body):
-            pre_char = body[match.start()-1:match.start()] if match.start() > 0 else ""
-            post_char = body[match.end():match.end()+1] if match.end() < len(body) else ""
-            if pre_char != '`' and post_char != '`':
-                all_matches.append({'start': match.start(), 'end': match.end(), 'text': match.group(0)})
-    if not all_matches: return body
-    all_matches.sort(key=lambda m: (m['start'], -(m['end'] - m['start'])))
-    unique_matches = []
-    last_processed_end = -1
-    for match in all_matches:
-        if match['start'] >= last_processed_end:
-            unique_matches.append(match)
-            last_processed_end = match['end']
-    result_parts = []
-    current_pos = 0
-    for match in unique_matches:
-        if match['start'] > current_pos: result_parts.append(body[current_pos:match['start']])
-        result_parts.append(f"`{match['text']}`")
-        current_pos = match['end']
-    if current_pos < len(body): result_parts.append(body[current_pos:])
-    return "".join(result_parts)
+    return CODE_PATTERN.sub(r'`\g<0>`', body)
+
+def format_codes_in_messages(bodies: list[str]) -> list[str]:
+    # One sub over the whole history joined by NUL: NUL is a non-word, non-backtick character, so every message edge
+    # behaves exactly like a string edge and no match can cross it. Bodies that contain NUL take the per-message path.
+    if not bodies: return []
+    joined = MESSAGE_SEPARATOR.join(body or "" for body in bodies)
+    if joined.count(MESSAGE_SEPARATOR) != len(bodies) - 1: return [format_codes_in_message(body) for body in bodies]
+    return CODE_PATTERN.sub(r'`\g<0>`', joined).split(MESSAGE_SEPARATOR)
+
+# --- Per-number message cache ---
+# Each number keeps its newest messages (already formatted) and a date_sent cursor, so a refresh only asks Twilio
+# for messages newer than the cursor and "older messages" pages are served from memory first.
+MESSAGE_PAGE_SIZE = 5
+MESSAGE_CACHE_PER_NUMBER = int(os.environ.get('MESSAGE_CACHE_PER_NUMBER', 100))
+MESSAGE_CACHE_NUMBERS = int(os.environ.get('MESSAGE_CACHE_NUMBERS', 5000))
+
+class NumberMessages:
+    __slots__ = ('entries', 'exhausted')
+
+    def __init__(self):
+        self.entries: list[dict] = []  # newest first
+        self.exhausted = False  # True once Twilio has nothing older than entries[-1]
+
+    def add(self, messages) -> int:
+        known = {entry['sid'] for entry in self.entries}
+        fresh = [m for m in messages if m.sid not in known]
+        bodies = format_codes_in_messages([m.body or "" for m in fresh])
+        self.entries.extend({'sid': m.sid, 'from': m.from_, 'body': body, 'date_sent': m.date_sent or m.date_created} for m, body in zip(fresh, bodies))
+        self.entries.sort(key=lambda entry: entry['date_sent'] or datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+        if len(self.entries) > MESSAGE_CACHE_PER_NUMBER:
+            del self.entries[MESSAGE_CACHE_PER_NUMBER:]
+            self.exhausted = False
+        return len(fresh)
+
+class MessageCache:
+    # Keyed by (account SID, number): a released number that is later bought on another account starts empty.
+    def __init__(self, max_numbers: int):
+        self._numbers = TTLCache(max_numbers, float('inf'))
+        self._flights = SingleFlight()
+
+    async def latest(self, client: Client, number: str) -> tuple[list[dict], bool]:
+        store = await self._flights.run(('latest', client.account_sid, number), partial(self._refresh, client, number))
+        return store.entries[:MESSAGE_PAGE_SIZE], self._has_more(store, 0)
+
+    async def _refresh(self, client: Client, number: str) -> NumberMessages:
+        store = self._numbers.get((client.account_sid, number))
+        if store is None or not store.entries:
+            store = NumberMessages()
+            messages = await twilio_call(client.messages.list, to=number, limit=MESSAGE_PAGE_SIZE)
+            store.add(messages)
+            store.exhausted = len(messages) < MESSAGE_PAGE_SIZE
+        else:
+            cursor = store.entries[0]['date_sent']  # date_sent_after (DateSent>=) is inclusive; add() skips known SIDs
+            store.add(await twilio_call(client.messages.list, to=number, date_sent_after=cursor, limit=MESSAGE_CACHE_PER_NUMBER))
+        self._numbers.set((client.account_sid, number), store)
+        return store
+
+    async def page(self, client: Client, number: str, offset: int) -> tuple[list[dict], bool]:
+        store = self._numbers.get((client.account_sid, number))
+        if store is None: store = await self._refresh(client, number)
+        if len(store.entries) < offset + MESSAGE_PAGE_SIZE and offset < MESSAGE_CACHE_PER_NUMBER and not store.exhausted and store.entries:
+            oldest = store.entries[-1]['date_sent']
+            # date_sent_before (DateSent<=) is inclusive and second-granular; the boundary messages come back again and are
+            # de-duplicated by SID, so fetch a double page to still get older ones.
+            messages = await twilio_call(client.messages.list, to=number, date_sent_before=oldest, limit=MESSAGE_PAGE_SIZE * 2)
+            if store.add(messages) == 0 or len(messages) < MESSAGE_PAGE_SIZE * 2: store.exhausted = True
+        return store.entries[offset:offset + MESSAGE_PAGE_SIZE], self._has_more(store, offset)
+
+    def _has_more(self, store: NumberMessages, offset: int) -> bool:
+        # Only the newest MESSAGE_CACHE_PER_NUMBER messages are pageable; anything older would be trimmed on arrival.
+        if offset + MESSAGE_PAGE_SIZE >= MESSAGE_CACHE_PER_NUMBER: return False
+        return len(store.entries) > offset + MESSAGE_PAGE_SIZE or not store.exhausted
+
+    def evict(self, account_sid: str, number: str):
+        self._numbers.pop((account_sid, number))
+
+message_cache = MessageCache(MESSAGE_CACHE_NUMBERS)
+metrics.register_cache('messages', message_cache._numbers)
 
 async def display_numbers_with_buy_buttons(message_object, context: ContextTypes.DEFAULT_TYPE, available_numbers, intro_text: str):
     if not available_numbers:
@@ -110,43 +647,80 @@ async def display_numbers_with_buy_buttons(message_object, context: ContextTypes
     inline_reply_markup = InlineKeyboardMarkup(keyboard_buttons)
     await message_object.reply_text(full_message_text, reply_markup=inline_reply_markup, parse_mode='Markdown')
 
+# --- Membership cache for the force-subscribe check ---
+# Positive and negative answers are cached separately so a freshly joined user is not locked out for long.
+MEMBERSHIP_CACHE_SIZE = int(os.environ.get('MEMBERSHIP_CACHE_SIZE', 50000))
+MEMBERSHIP_POSITIVE_TTL = float(os.environ.get('MEMBERSHIP_POSITIVE_TTL', 600))
+MEMBERSHIP_NEGATIVE_TTL = float(os.environ.get('MEMBERSHIP_NEGATIVE_TTL', 30))
+CHANNEL_TITLE_TTL = float(os.environ.get('CHANNEL_TITLE_TTL', 3600))
+MEMBER_STATUSES = {'member', 'administrator', 'creator'}
+membership_cache = TTLCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_POSITIVE_TTL)
+channel_title_cache = TTLCache(1, CHANNEL_TITLE_TTL)
+metrics.register_cache('membership', membership_cache)
+metrics.register_cache('channel_title', channel_title_cache)
+
+def _remember_membership(user_id: int, status: str) -> bool:
+    is_member = status.lower() in MEMBER_STATUSES
+    membership_cache.set(user_id, is_member, ttl=MEMBERSHIP_POSITIVE_TTL if is_member else MEMBERSHIP_NEGATIVE_TTL)
+    return is_member
+
+async def is_channel_member(bot, user_id: int) -> bool:
+    cached = membership_cache.get(user_id)
+    if cached is not None: return cached
+    try:
+        member = await bot.get_chat_member(chat_id=FORCE_SUB_CHANNEL_ID, user_id=user_id)
+    except Exception as e:
+        logger.warning(f"Could not check channel membership for {user_id}: {e}")
+        return False
+    return _remember_membership(user_id, member.status)
+
+async def get_channel_title(bot) -> str | None:
+    title = channel_title_cache.get(FORCE_SUB_CHANNEL_ID)
+    if title is not None: return title
+    try:
+        chat = await bot.get_chat(chat_id=FORCE_SUB_CHANNEL_ID)
+    except Exception as e:
+        logger.warning(f"Could not fetch channel title: {e}. Using default text.")
+        return None
+    channel_title_cache.set(FORCE_SUB_CHANNEL_ID, chat.title)
+    return chat.title
+
+async def track_channel_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Delivered only while the bot is an admin of the channel; keeps the cache in sync with joins and leaves.
+    change = update.chat_member
+    if change.chat.id != FORCE_SUB_CHANNEL_ID: return
+    _remember_membership(change.new_chat_member.user.id, change.new_chat_member.status)
+
 # --- ফোর্স সাবস্ক্রাইব চেকের জন্য ডেкоರೇটর ---
 def force_subscribe_check(func):
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user_id = update.effective_user.id
-        try:
-            member = await context.bot.get_chat_member(chat_id=FORCE_SUB_CHANNEL_ID, user_id=user_id)
-            if member.status.lower() in ['member', 'administrator', 'creator']:
-                return await func(update, context, *args, **kwargs)
-            else:
-                raise Exception("User is not a member")
-        except Exception:
-            channel_name_display = ""
+        if await is_channel_member(context.bot, user_id):
+            return await func(update, context, *args, **kwargs)
+        channel_title = await get_channel_title(context.bot)
+        if channel_title:
+            channel_name_display = f"**{channel_title}**"
+            button_channel_text = f"{channel_title}"
+        else:
+            channel_name_display = "এই চ্যানেল"
             button_channel_text = "আমাদের চ্যানেলে"
-            try:
-                chat = await context.bot.get_chat(chat_id=FORCE_SUB_CHANNEL_ID)
-                channel_name_display = f"**{chat.title}**"
-                button_channel_text = f"{chat.title}"
-            except Exception as e:
-                logger.warning(f"Could not fetch channel title: {e}. Using default text.")
-                channel_name_display = "এই চ্যানেল"
-
-            join_text = (
-                f"👋 **স্বাগতম!**\n\n"
-                f"আমাদের **Twilio Boss Bot** টি সম্পূর্ণ বিনামূল্যে ব্যবহার করার আগে, আপনাকে ছোট্ট একটি কাজ করতে হবে।\n\n"
-                f"✅ অনুগ্রহ করে {channel_name_display} -এ যোগ দিন।\n\n"
-                f"সেখানে আপনি নানা রকম প্রিমিয়াম মেথড বিনামূল্যে পাবেন এবং বট সংক্রান্ত সব ধরনের সাপোর্ট ও আপডেট সবার আগে পেয়ে যাবেন।"
-            )
-            keyboard = [[InlineKeyboardButton(f"✅ {button_channel_text} এ যোগ দিন", url=FORCE_SUB_CHANNEL_LINK)]]
-            
-            if update.callback_query:
-                await update.callback_query.answer()
-                await update.callback_query.message.reply_text(join_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-            else:
-                await update.message.reply_text(join_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
 
-            return ConversationHandler.END
+        join_text = (
+            f"👋 **স্বাগতম!**\n\n"
+            f"আমাদের **Twilio Boss Bot** টি সম্পূর্ণ বিনামূল্যে ব্যবহার করার আগে, আপনাকে ছোট্ট একটি কাজ করতে হবে।\n\n"
+            f"✅ অনুগ্রহ করে {channel_name_display} -এ যোগ দিন।\n\n"
+            f"সেখানে আপনি নানা রকম প্রিমিয়াম মেথড বিনামূল্যে পাবেন এবং বট সংক্রান্ত সব ধরনের সাপোর্ট ও আপডেট সবার আগে পেয়ে যাবেন।"
+        )
+        keyboard = [[InlineKeyboardButton(f"✅ {button_channel_text} এ যোগ দিন", url=FORCE_SUB_CHANNEL_LINK)]]
+        
+        if update.callback_query:
+            await update.callback_query.answer()
+            await update.callback_query.message.reply_text(join_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+        else:
+            await update.message.reply_text(join_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+
+        return ConversationHandler.END
 
     return wrapper
 
@@ -154,30 +728,632 @@ def force_subscribe_check(func):
 AWAITING_CREDENTIALS, AWAITING_CA_AREA_CODE = 0, 1
 START_COMMAND_TEXT, LOGIN_TEXT, BUY_TEXT, SHOW_MESSAGES_TEXT, REMOVE_NUMBER_TEXT, LOGOUT_TEXT, SUPPORT_TEXT = '🏠 /start', '🔑 Login', '🛒 Buy Number', '✉️ Show Messages', '🗑️ Remove Number', '↪️ Logout', '💬 Support'
 PURCHASE_CALLBACK_PREFIX, CONFIRM_REMOVE_YES_CALLBACK, CONFIRM_REMOVE_NO_CALLBACK, DIRECT_REMOVE_AFTER_SHOW_MSG_CALLBACK = 'purchase_', 'confirm_remove_yes', 'confirm_remove_no', 'direct_remove_this_number'
+OLDER_MESSAGES_CALLBACK_PREFIX = 'older_msgs_'
 menu_keyboard = [[START_COMMAND_TEXT, LOGIN_TEXT], [BUY_TEXT, SHOW_MESSAGES_TEXT], [REMOVE_NUMBER_TEXT, LOGOUT_TEXT], [SUPPORT_TEXT]]
 reply_markup = ReplyKeyboardMarkup(menu_keyboard, resize_keyboard=True)
 
+# --- Per-user single-flight, idempotency and rate limiting ---
+# Purchase/remove presses are keyed by user + callback data: a duplicate press while the first is running awaits
+# the same result, and one arriving shortly after a success is ignored. Operations of one user run under a
+# per-user lock, and a token bucket per user protects the shared Twilio and Telegram quotas.
+IDEMPOTENCY_TTL = float(os.environ.get('IDEMPOTENCY_TTL', 30))
+USER_RATE_LIMIT = float(os.environ.get('USER_RATE_LIMIT', 1))  # sustained actions per second
+USER_RATE_BURST = float(os.environ.get('USER_RATE_BURST', 5))
+SLOW_DOWN_TEXT = "⏳ খুব দ্রুত চাপ দিচ্ছেন, একটু পরে আবার চেষ্টা করুন।"
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate, self.capacity = rate, capacity
+        self.tokens, self.updated = capacity, time.monotonic()
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < tokens: return False
+        self.tokens -= tokens
+        return True
+
+    async def acquire(self, tokens: float = 1):
+        while not self.try_acquire(tokens):
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+class UserOperations:
+    def __init__(self):
+        self._locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        self._flights = SingleFlight()
+        self._completed = TTLCache(10000, IDEMPOTENCY_TTL)
+        self._buckets = TTLCache(50000, max(USER_RATE_BURST / USER_RATE_LIMIT, 1) * 2)
+
+    def lock(self, user_id: int) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None: self._locks[user_id] = lock = asyncio.Lock()
+        return lock
+
+    def allow(self, user_id: int) -> bool:
+        bucket = self._buckets.get(user_id)
+        if bucket is None: bucket = TokenBucket(USER_RATE_LIMIT, USER_RATE_BURST)
+        self._buckets.set(user_id, bucket)
+        return bucket.try_acquire()
+
+    async def run_once(self, user_id: int, key, factory):
+        idempotency_key = (user_id, key)
+        if self._completed.get(idempotency_key) is not None: return None
+        async def locked():
+            async with self.lock(user_id):
+                result = await factory()
+            if result: self._completed.set(idempotency_key, True)
+            return result
+        return await self._flights.run(idempotency_key, locked)
+
+user_operations = UserOperations()
+
+async def answer_or_throttle(query) -> bool:
+    if not user_operations.allow(query.from_user.id):
+        await query.answer(SLOW_DOWN_TEXT, show_alert=True)
+        return False
+    await query.answer()
+    return True
+
+# --- Outbound message queue and broadcasts ---
+# Bot-initiated messages (purchase notices, SMS pushes, broadcasts) go through one queue that respects Telegram's
+# global and per-chat flood limits and backs off on RetryAfter; interactive messages jump ahead of broadcasts.
+TELEGRAM_GLOBAL_RATE = float(os.environ.get('TELEGRAM_GLOBAL_RATE', 25))
+TELEGRAM_PER_CHAT_RATE = float(os.environ.get('TELEGRAM_PER_CHAT_RATE', 1))
+TELEGRAM_PER_CHAT_BURST = float(os.environ.get('TELEGRAM_PER_CHAT_BURST', 3))
+OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', 8))
+OUTBOX_MAX_ATTEMPTS = 5
+PRIORITY_INTERACTIVE, PRIORITY_BULK = 0, 1
+ADMIN_IDS = {int(uid) for uid in os.environ.get('ADMIN_IDS', '').replace(',', ' ').split()}
+BROADCAST_STATE_FILE = 'broadcast_state.json'
+BROADCAST_TARGETS_FILE = 'broadcast_targets.json'
+BROADCAST_CHUNK = 100
+
+class Outbox:
+    def __init__(self):
+        self._queue: asyncio.PriorityQueue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._global = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+        self._chats = TTLCache(100000, 60)
+        self._sequence = itertools.count()
+        self.bot = None
+        self.sent = self.failed = self.retries = self.delayed = 0
+
+    def start(self, bot):
+        self.bot, self._queue = bot, asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(OUTBOX_WORKERS)]
+
+    async def stop(self):
+        for worker in self._workers: worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers, self._queue = [], None
+
+    async def send(self, chat_id: int, text: str, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        if self._queue is None: return await telegram_bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((priority, next(self._sequence), chat_id, text, kwargs, future, 1))
+        return await future
+
+    async def _worker(self):
+        # Workers never sleep out a backoff: a message that has to wait is parked with call_later and re-enters the
+        # queue when it is due, so a flood-limited broadcast cannot tie up the workers interactive messages need.
+        while True:
+            item = await self._queue.get()
+            priority, _, chat_id, text, kwargs, future, attempt = item
+            try:
+                if future.done(): continue
+                result = await self._deliver(chat_id, text, kwargs)
+                self.sent += 1
+                future.set_result(result)
+            except (BadRequest, Forbidden) as e:
+                self._fail(future, e)
+            except (RetryAfter, TimedOut, NetworkError) as e:
+                if attempt >= OUTBOX_MAX_ATTEMPTS: self._fail(future, e)
+                else: self._retry_later(item, e)
+            except Exception as e:
+                self._fail(future, e)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, chat_id: int, text: str, kwargs: dict):
+        bucket = self._chats.get(chat_id)
+        if bucket is None: bucket = TokenBucket(TELEGRAM_PER_CHAT_RATE, TELEGRAM_PER_CHAT_BURST)
+        self._chats.set(chat_id, bucket)
+        await bucket.acquire()
+        await self._global.acquire()
+        return await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+
+    def _fail(self, future: asyncio.Future, error: Exception):
+        self.failed += 1
+        if not future.done(): future.set_exception(error)
+
+    def _retry_later(self, item: tuple, error: Exception):
+        priority, _, chat_id, text, kwargs, future, attempt = item
+        if isinstance(error, RetryAfter):
+            delay = error.retry_after.total_seconds() if isinstance(error.retry_after, timedelta) else error.retry_after
+            logger.warning(f"Flood limit hit sending to {chat_id}; retrying in {delay}s.")
+        else:
+            delay = min(2 ** attempt, 30)
+        self.retries += 1
+        self.delayed += 1
+        asyncio.get_running_loop().call_later(delay, self._requeue, (priority, next(self._sequence), chat_id, text, kwargs, future, attempt + 1))
+
+    def _requeue(self, item: tuple):
+        self.delayed -= 1
+        future = item[5]
+        if future.done(): return
+        if self._queue is None: future.cancel()
+        else: self._queue.put_nowait(item)
+
+    def stats(self) -> dict:
+        return {'queued': self._queue.qsize() if self._queue else 0, 'delayed': self.delayed, 'sent': self.sent, 'failed': self.failed, 'retries': self.retries}
+
+outbox = Outbox()
+metrics.register_gauges('outbox', outbox.stats)
+active_broadcast: asyncio.Task | None = None
+
+async def save_broadcast_state(state: dict | None, targets: list[int] | None = None):
+    # The target list is written once when a broadcast starts; after each chunk only the small state record is rewritten.
+    loop = asyncio.get_running_loop()
+    if state is None:
+        for path in (BROADCAST_STATE_FILE, BROADCAST_TARGETS_FILE):
+            if os.path.exists(path): await loop.run_in_executor(session_executor, os.remove, path)
+        return
+    if targets is not None: await loop.run_in_executor(session_executor, atomic_write_json, BROADCAST_TARGETS_FILE, {'id': state['id'], 'users': targets})
+    await loop.run_in_executor(session_executor, atomic_write_json, BROADCAST_STATE_FILE, dict(state))
+
+def load_broadcast_state() -> tuple[dict, list[int]] | None:
+    if not os.path.exists(BROADCAST_STATE_FILE): return None
+    try:
+        with open(BROADCAST_STATE_FILE, 'r') as f:
+            state = json.load(f)
+        with open(BROADCAST_TARGETS_FILE, 'r') as f:
+            targets = json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        logger.error(f"Could not load broadcast progress from {BROADCAST_STATE_FILE}: {e}")
+        return None
+    if targets.get('id') != state.get('id'):
+        logger.error(f"Broadcast target list does not belong to broadcast {state.get('id')}; not resuming.")
+        return None
+    return state, targets['users']
+
+async def run_broadcast(state: dict, targets: list[int]):
+    # Progress is saved after every chunk, so a restart resumes with the users that have not been messaged yet.
+    started = time.monotonic()
+    resumed_at = state['offset']
+    while state['offset'] < len(targets):
+        chunk = targets[state['offset']:state['offset'] + BROADCAST_CHUNK]
+        results = await asyncio.gather(*(outbox.send(uid, state['text'], priority=PRIORITY_BULK) for uid in chunk), return_exceptions=True)
+        failed = sum(isinstance(result, Exception) for result in results)
+        state['sent'] += len(chunk) - failed
+        state['failed'] += failed
+        state['offset'] += len(chunk)
+        await save_broadcast_state(state)
+    elapsed = time.monotonic() - started
+    rate = (state['offset'] - resumed_at) / elapsed if elapsed else 0.0
+    report = f"📣 ব্রডকাস্ট শেষ হয়েছে।\n✅ পাঠানো: {state['sent']}\n❌ ব্যর্থ: {state['failed']}\n⏱️ সময়: {elapsed:.1f}s ({rate:.1f} msg/s)"
+    logger.info(f"Broadcast {state['id']} finished: {state['sent']} sent, {state['failed']} failed, {rate:.1f} msg/s.")
+    await save_broadcast_state(None)
+    try:
+        await outbox.send(state['admin_id'], report)
+    except Exception as e:
+        logger.error(f"Could not deliver broadcast report: {e}")
+
+# --- Owned-number inventory ---
+# session['numbers'] maps each owned number to its IncomingPhoneNumber SID, purchase time and capabilities;
+# session['number'] stays the active number used by the menu. The reverse index maps numbers back to users.
+NUMBER_RECONCILE_INTERVAL = float(os.environ.get('NUMBER_RECONCILE_INTERVAL', 3600))  # 0 disables reconciliation
+
+class NumberInventory:
+    def __init__(self):
+        self._owners: dict[str, int] = {}
+
+    def rebuild(self):
+        self._owners.clear()
+        for uid, data in user_sessions.items():
+            numbers = data.setdefault('numbers', {})
+            if data.get('number') and data['number'] not in numbers:
+                numbers[data['number']] = {'sid': None, 'purchased_at': None, 'capabilities': None}
+            for phone in numbers: self._owners[phone] = uid
+
+    def add(self, user_id: int, number):
+        session = user_sessions[user_id]
+        capabilities = getattr(number, 'capabilities', None)
+        session.setdefault('numbers', {})[number.phone_number] = {'sid': number.sid, 'purchased_at': time.time(), 'capabilities': dict(capabilities) if isinstance(capabilities, dict) else None}
+        session['number'] = number.phone_number
+        self._owners[number.phone_number] = user_id
+        save_session(user_id)
+
+    def remove(self, user_id: int, phone_number: str, account_sid: str | None = None):
+        # Every path that drops a number (release, 404, reconcile, sweep) also drops its cached messages.
+        if self._owners.get(phone_number) == user_id: del self._owners[phone_number]
+        session = user_sessions.get(user_id)
+        account_sid = account_sid or (session or {}).get('sid')
+        if account_sid: message_cache.evict(account_sid, phone_number)
+        if session is None: return
+        numbers = session.setdefault('numbers', {})
+        numbers.pop(phone_number, None)
+        if session.get('number') == phone_number: session['number'] = next(iter(numbers), None)
+        save_session(user_id)
+
+    def adopt(self, user_id: int, phone_number: str, sid: str | None):
+        session = user_sessions[user_id]
+        session.setdefault('numbers', {}).setdefault(phone_number, {'sid': sid, 'purchased_at': None, 'capabilities': None})
+        if not session.get('number'): session['number'] = phone_number
+        self._owners[phone_number] = user_id
+        save_session(user_id)
+
+    def forget_user(self, user_id: int):
+        for phone in self.numbers_for(user_id):
+            if self._owners.get(phone) == user_id: del self._owners[phone]
+
+    def owner(self, phone_number: str) -> int | None:
+        return self._owners.get(phone_number)
+
+    def numbers_for(self, user_id: int) -> dict:
+        return user_sessions.get(user_id, {}).get('numbers', {})
+
+    def sid_for(self, user_id: int, phone_number: str) -> str | None:
+        return self.numbers_for(user_id).get(phone_number, {}).get('sid')
+
+    def reconcile(self, user_id: int, owned_numbers):
+        # Fill in missing SIDs and drop numbers released outside the bot; numbers the bot never bought are left alone.
+        by_phone = {n.phone_number: n for n in owned_numbers}
+        for phone, record in list(self.numbers_for(user_id).items()):
+            twilio_number = by_phone.get(phone)
+            if twilio_number is None:
+                logger.info(f"Number {phone} of user {user_id} is no longer on the Twilio account; dropping it.")
+                self.remove(user_id, phone)
+            elif record.get('sid') != twilio_number.sid:
+                record['sid'] = twilio_number.sid
+                save_session(user_id)
+
+number_inventory = NumberInventory()
+
+async def reconcile_number_inventory():
+    while True:
+        await asyncio.sleep(NUMBER_RECONCILE_INTERVAL)
+        for user_id in [uid for uid, data in user_sessions.items() if data.get('numbers')]:
+            client = await get_twilio_client(user_id)
+            if client is None: continue
+            # Holding the user's lock keeps a purchase or logout from landing between the list call and the diff.
+            async with user_operations.lock(user_id):
+                if user_id not in user_sessions: continue
+                try:
+                    owned_numbers = await twilio_call(client.incoming_phone_numbers.list, page_size=1000)
+                except Exception as e:
+                    logger.warning(f"Reconciling numbers for {user_id} failed: {e}")
+                    continue
+                number_inventory.reconcile(user_id, owned_numbers)
+
+# --- Inbound SMS push (Twilio webhook) ---
+# With PUBLIC_BASE_URL set, purchased numbers get their sms_url pointed at this bot and new messages are pushed
+# to the owner's chat right away; "Show Messages" polling stays as the fallback.
+PORT = int(os.environ.get('PORT', 8080))
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '').rstrip('/')
+AUTO_SMS_WEBHOOK = os.environ.get('AUTO_SMS_WEBHOOK', '1') == '1'
+TWILIO_SMS_WEBHOOK_PATH = '/twilio/sms'
+EMPTY_TWIML = '<?xml version="1.0" encoding="UTF-8"?><Response></Response>'
+telegram_bot = None
+bot_loop: asyncio.AbstractEventLoop | None = None
+
+def sms_webhook_url() -> str | None:
+    if PUBLIC_BASE_URL and AUTO_SMS_WEBHOOK: return f"{PUBLIC_BASE_URL}{TWILIO_SMS_WEBHOOK_PATH}"
+    return None
+
+def authenticate_inbound_sms(url: str, params: dict, signature: str) -> int | None:
+    owner = number_inventory.owner(params.get('To', ''))
+    session = user_sessions.get(owner) if owner is not None else None
+    if not session or session.get('sid') != params.get('AccountSid'): return None
+    if not RequestValidator(session['auth']).validate(url, params, signature): return None
+    return owner
+
+async def deliver_inbound_sms(user_id: int, params: dict):
+    text = (f"📨 আপনার নম্বর (`{params.get('To')}`) এ নতুন মেসেজ এসেছে:\n"
+            f"\n➡️ **From:** `{params.get('From')}`\n📝 **Msg:** {format_codes_in_message(params.get('Body', ''))}")
+    try:
+        await outbox.send(user_id, text, parse_mode='Markdown')
+    except Exception as e:
+        logger.error(f"Failed to push inbound SMS to {user_id}: {e}")
+
 # Flask App
 flask_app = Flask(__name__)
 @flask_app.route('/')
 def keep_alive_route(): return 'Bot is alive!'
-def run_flask(): flask_app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
+
+@flask_app.route('/metrics')
+def metrics_route(): return metrics.render(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
+
+@flask_app.route(TWILIO_SMS_WEBHOOK_PATH, methods=['POST'])
+def twilio_sms_route():
+    params = request.form.to_dict()
+    url = f"{PUBLIC_BASE_URL}{TWILIO_SMS_WEBHOOK_PATH}" if PUBLIC_BASE_URL else request.url
+    owner = authenticate_inbound_sms(url, params, request.headers.get('X-Twilio-Signature', ''))
+    if owner is None:
+        logger.warning(f"Rejected inbound SMS webhook for {params.get('To')}")
+        return '', 403
+    if bot_loop is None: return '', 503
+    asyncio.run_coroutine_threadsafe(deliver_inbound_sms(owner, params), bot_loop)
+    return EMPTY_TWIML, 200, {'Content-Type': 'text/xml'}
+
+def run_flask(): flask_app.run(host='0.0.0.0', port=PORT)
+
+# --- Webhook mode: one aiohttp server in the bot's event loop ---
+# BOT_MODE=webhook serves the Telegram webhook, the keep-alive route and the Twilio SMS callback from a single
+# server on PORT, with no Flask thread; polling (plus the Flask thread) stays the default for local runs.
+BOT_MODE = os.environ.get('BOT_MODE', 'polling')
+TELEGRAM_WEBHOOK_PATH = os.environ.get('TELEGRAM_WEBHOOK_PATH', '/telegram')
+# Telegram echoes this token in every webhook request; without it anyone could POST forged updates for any user id.
+# When unset, a fresh one is generated per process and registered through set_webhook at startup.
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+
+def build_web_app(application: Application) -> web.Application:
+    async def keep_alive(request: web.Request) -> web.Response:
+        return web.Response(text='Bot is alive!')
+
+    async def metrics_endpoint(request: web.Request) -> web.Response:
+        return web.Response(body=metrics.render().encode(), headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+    async def telegram_webhook(request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), WEBHOOK_SECRET):
+            return web.Response(status=403)
+        await application.update_queue.put(Update.de_json(await request.json(), application.bot))
+        return web.Response()
+
+    async def twilio_sms(request: web.Request) -> web.Response:
+        params = dict(await request.post())
+        url = f"{PUBLIC_BASE_URL}{TWILIO_SMS_WEBHOOK_PATH}" if PUBLIC_BASE_URL else str(request.url)
+        owner = authenticate_inbound_sms(url, params, request.headers.get('X-Twilio-Signature', ''))
+        if owner is None:
+            logger.warning(f"Rejected inbound SMS webhook for {params.get('To')}")
+            return web.Response(status=403)
+        application.create_task(deliver_inbound_sms(owner, params))
+        return web.Response(text=EMPTY_TWIML, content_type='text/xml')
+
+    web_app = web.Application()
+    web_app.router.add_get('/', keep_alive)
+    web_app.router.add_get('/metrics', metrics_endpoint)
+    web_app.router.add_post(TELEGRAM_WEBHOOK_PATH, telegram_webhook)
+    web_app.router.add_post(TWILIO_SMS_WEBHOOK_PATH, twilio_sms)
+    return web_app
+
+async def run_webhook(application: Application):
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM): loop.add_signal_handler(sig, stop_event.set)
+    runner = web.AppRunner(build_web_app(application))
+    await runner.setup()
+    await application.initialize()
+    await on_startup(application)
+    try:
+        await application.bot.set_webhook(url=f"{PUBLIC_BASE_URL}{TELEGRAM_WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+        await application.start()
+        await web.TCPSite(runner, '0.0.0.0', PORT).start()
+        logger.info(f"Webhook server listening on port {PORT}.")
+        await stop_event.wait()
+    finally:
+        await runner.cleanup()
+        if application.running: await application.stop()
+        await on_shutdown(application)
+        await application.shutdown()
 
 # Helper function to release number
+async def _delete_twilio_number(user_id: int, client: Client, number_to_release: str, sid: str | None = None) -> bool:
+    sid = sid or number_inventory.sid_for(user_id, number_to_release)
+    if sid is None:
+        incoming_phone_numbers = await twilio_call(client.incoming_phone_numbers.list, phone_number=number_to_release, limit=1)
+        if not incoming_phone_numbers:
+            number_inventory.remove(user_id, number_to_release, client.account_sid)
+            return False
+        sid = incoming_phone_numbers[0].sid
+    try:
+        await twilio_call(client.incoming_phone_numbers(sid).delete)
+    except TwilioRestException as e:
+        if e.status != 404: raise
+        number_inventory.remove(user_id, number_to_release, client.account_sid)
+        return False
+    number_inventory.remove(user_id, number_to_release, client.account_sid)
+    return True
+
 async def _release_twilio_number(user_id: int, client: Client, number_to_release: str) -> tuple[bool, str]:
     try:
-        incoming_phone_numbers = client.incoming_phone_numbers.list(phone_number=number_to_release, limit=1)
-        if not incoming_phone_numbers:
+        if not await _delete_twilio_number(user_id, client, number_to_release):
             return False, f"❓ নম্বর `{number_to_release}` আপনার অ্যাকাউন্টে পাওয়া যায়নি।"
-        client.incoming_phone_numbers(incoming_phone_numbers[0].sid).delete()
-        if user_id in user_sessions:
-            user_sessions[user_id]['number'] = None
-            save_sessions()
         return True, f"🗑️ নম্বর `{number_to_release}` সফলভাবে রিমুভ করা হয়েছে!"
     except Exception as e:
         logger.error(f"Failed during release: {e}")
         return False, f"⚠️ নম্বর `{number_to_release}` রিমুভ করতে সমস্যা হয়েছে।"
 
+async def _provision_twilio_number(user_id: int, client: Client, number_to_buy: str):
+    create_kwargs = {'phone_number': number_to_buy}
+    webhook_url = sms_webhook_url()
+    if webhook_url: create_kwargs.update(sms_url=webhook_url, sms_method='POST')
+    number = await twilio_call(client.incoming_phone_numbers.create, **create_kwargs)
+    number_inventory.add(user_id, number)
+    number_search_cache.evict_number(number.phone_number)
+    return number
+
+# --- Bulk number operations ---
+# Bulk buy/release and the admin sweep fan out over a semaphore; each item retries transient Twilio failures
+# with full-jitter backoff, checking first whether a timed-out attempt took effect. A progress message is edited in place and a per-item JSON report
+# is written to BULK_REPORT_DIR when the run ends. Accounts that log out while still holding numbers are queued
+# in RELEASE_SWEEP_FILE so /sweep (or the periodic sweep) can release them.
+BULK_CONCURRENCY = int(os.environ.get('BULK_CONCURRENCY', 4))
+BULK_MAX_ATTEMPTS = int(os.environ.get('BULK_MAX_ATTEMPTS', 3))
+BULK_RETRY_BASE = float(os.environ.get('BULK_RETRY_BASE', 1))
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 20))
+BULK_PROGRESS_INTERVAL = 2.0
+BULK_REPORT_DIR = os.environ.get('BULK_REPORT_DIR', 'bulk_reports')
+RELEASE_SWEEP_FILE = 'release_sweep.json'
+RELEASE_SWEEP_INTERVAL = float(os.environ.get('RELEASE_SWEEP_INTERVAL', 0))  # 0 disables the periodic sweep
+
+def classify_failure(error: Exception) -> str:
+    # 'retry': Twilio never acted on the request; 'unknown': it may have been applied (timeouts keep running in the
+    # worker thread), so the item is verified before retrying; 'fatal': retrying cannot help.
+    if isinstance(error, TwilioRestException):
+        if error.status == 429: return 'retry'
+        return 'unknown' if error.status >= 500 else 'fatal'
+    if isinstance(error, ConnectTimeout): return 'retry'
+    if isinstance(error, (TimeoutError, RequestException)): return 'unknown'
+    return 'fatal'
+
+async def run_bulk(kind: str, items: list, operation, progress_message=None, verify=None) -> dict:
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+    results = [None] * len(items)
+    last_edit = 0.0
+
+    async def show_progress(final: bool = False):
+        nonlocal last_edit
+        if progress_message is None or (not final and time.monotonic() - last_edit < BULK_PROGRESS_INTERVAL): return
+        last_edit = time.monotonic()
+        done = [r for r in results if r is not None]
+        ok = sum(r['ok'] for r in done)
+        text = f"⚙️ {kind}: {len(done)}/{len(items)} সম্পন্ন (✅ {ok}, ❌ {len(done) - ok})"
+        if final: text += "\n" + "\n".join(f"{'✅' if r['ok'] else '❌'} {r['item']} {r['detail']}" for r in done[:BULK_MAX_ITEMS * 2])
+        try:
+            await progress_message.edit_text(text)
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower(): logger.warning(f"Could not update bulk progress: {e}")
+
+    async def run_item(index: int, item):
+        async with semaphore:
+            uncertain = False
+            for attempt in range(1, BULK_MAX_ATTEMPTS + 1):
+                try:
+                    if uncertain and verify and (found := await verify(item)):
+                        ok, detail = found
+                        break
+                    ok, detail = await operation(item)
+                    break
+                except Exception as e:
+                    ok, detail = False, str(e)[:120]
+                    outcome = classify_failure(e)
+                    uncertain = uncertain or outcome == 'unknown'
+                    if attempt == BULK_MAX_ATTEMPTS or outcome == 'fatal': break
+                    await asyncio.sleep(random.uniform(0, BULK_RETRY_BASE * 2 ** attempt))
+            if not ok and uncertain and verify:
+                # A retry can fail only because an earlier, timed-out attempt went through after all.
+                try:
+                    if found := await verify(item): ok, detail = found
+                except Exception as e:
+                    logger.warning(f"Could not verify bulk {kind} item {item}: {e}")
+            results[index] = {'item': item, 'ok': ok, 'attempts': attempt, 'detail': detail}
+        await show_progress()
+
+    started = time.time()
+    await asyncio.gather(*(run_item(i, item) for i, item in enumerate(items)))
+    report = {'kind': kind, 'started_at': started, 'finished_at': time.time(), 'results': results}
+    path = os.path.join(BULK_REPORT_DIR, f"{kind}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}.json")
+    try:
+        await asyncio.get_running_loop().run_in_executor(session_executor, partial(os.makedirs, BULK_REPORT_DIR, exist_ok=True))
+        await asyncio.get_running_loop().run_in_executor(session_executor, atomic_write_json, path, report)
+    except OSError as e:
+        logger.error(f"Could not write bulk report {path}: {e}")
+    logger.info(f"Bulk {kind} finished: {sum(r['ok'] for r in results)}/{len(items)} ok, report {path}.")
+    await show_progress(final=True)
+    return report
+
+async def _find_twilio_number(client: Client, phone_number: str):
+    owned = await twilio_call(client.incoming_phone_numbers.list, phone_number=phone_number, limit=1)
+    return owned[0] if owned else None
+
+async def bulk_buy(user_id: int, client: Client, numbers: list[str], progress_message=None) -> dict:
+    async def buy(phone: str):
+        await _provision_twilio_number(user_id, client, phone)
+        return True, "কেনা হয়েছে"
+    async def bought(phone: str):
+        number = await _find_twilio_number(client, phone)
+        if number is None: return None
+        number_inventory.add(user_id, number)
+        number_search_cache.evict_number(phone)
+        return True, "কেনা হয়েছে"
+    return await run_bulk('buy', numbers, buy, progress_message, verify=bought)
+
+async def bulk_release(user_id: int, client: Client, numbers: list[str], progress_message=None) -> dict:
+    async def release(phone: str):
+        return (True, "রিমুভ হয়েছে") if await _delete_twilio_number(user_id, client, phone) else (False, "পাওয়া যায়নি")
+    async def released(phone: str):
+        if await _find_twilio_number(client, phone) is not None: return None
+        number_inventory.remove(user_id, phone, client.account_sid)
+        return True, "রিমুভ হয়েছে"
+    return await run_bulk('release', numbers, release, progress_message, verify=released)
+
+class ReleaseSweep:
+    # Pending releases keyed by Twilio account SID: {'auth', 'user_id', 'numbers': {phone: sid}}.
+    def __init__(self, path: str):
+        self.path = path
+        self.accounts: dict[str, dict] = {}
+        self.lock = asyncio.Lock()
+        self.running = asyncio.Lock()
+
+    def load(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, 'r') as f:
+                self.accounts = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            logger.error(f"Could not load pending releases from {self.path}: {e}")
+
+    async def save(self):
+        await asyncio.get_running_loop().run_in_executor(session_executor, atomic_write_json, self.path, dict(self.accounts))
+
+    async def record(self, user_id: int, session: dict) -> int:
+        numbers = {phone: (record or {}).get('sid') for phone, record in session.get('numbers', {}).items()}
+        if not numbers: return 0
+        async with self.lock:
+            entry = self.accounts.setdefault(session['sid'], {'auth': session['auth'], 'user_id': user_id, 'numbers': {}})
+            entry.update(auth=session['auth'], user_id=user_id)
+            entry['numbers'].update(numbers)
+            await self.save()
+        return len(numbers)
+
+    async def restore(self, user_id: int, account_sid: str):
+        async with self.lock:
+            entry = self.accounts.pop(account_sid, None)
+            if entry is None: return
+            for phone, sid in entry['numbers'].items(): number_inventory.adopt(user_id, phone, sid)
+            await self.save()
+
+    def pending(self) -> int:
+        return sum(len(entry['numbers']) for entry in self.accounts.values())
+
+    async def sweep(self, progress_message=None) -> dict:
+        # self.lock only guards the queue itself: it is held to snapshot the work and to merge the results, never
+        # across Twilio calls, so logout/login (which take it under the user's lock) never wait for a sweep.
+        async with self.running:
+            async with self.lock:
+                snapshot = {sid: dict(entry, numbers=dict(entry['numbers'])) for sid, entry in self.accounts.items()}
+            done = set()
+            async def release(key: str):
+                account_sid, phone = key.split(':', 1)
+                if phone not in self.accounts.get(account_sid, {}).get('numbers', {}):
+                    return True, "আবার লগইন করায় রাখা হয়েছে"
+                entry = snapshot[account_sid]
+                client = twilio_clients.client_for(account_sid, entry['auth'])
+                released = await _delete_twilio_number(entry['user_id'], client, phone, sid=entry['numbers'][phone])
+                # Released and already-gone numbers are both done; only failures stay queued for the next sweep.
+                done.add(key)
+                return True, "রিমুভ হয়েছে" if released else "আগেই রিমুভ হয়েছে"
+            items = [f"{account_sid}:{phone}" for account_sid, entry in snapshot.items() for phone in entry['numbers']]
+            report = await run_bulk('sweep', items, release, progress_message)
+            async with self.lock:
+                for key in done:
+                    account_sid, phone = key.split(':', 1)
+                    if account_sid in self.accounts: self.accounts[account_sid]['numbers'].pop(phone, None)
+                self.accounts = {sid: entry for sid, entry in self.accounts.items() if entry['numbers']}
+                await self.save()
+            return report
+
+release_sweep = ReleaseSweep(RELEASE_SWEEP_FILE)
+metrics.register_gauges('release_sweep', lambda: {'pending_numbers': release_sweep.pending()})
+
+async def periodic_release_sweep():
+    while True:
+        await asyncio.sleep(RELEASE_SWEEP_INTERVAL)
+        if release_sweep.accounts: await release_sweep.sweep()
+
 # --- Telegram Bot Handlers (with decorator) ---
 @force_subscribe_check
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -198,10 +1374,21 @@ async def receive_credentials(update: Update, context: ContextTypes.DEFAULT_TYPE
         if not (sid.startswith("AC") and len(sid) == 34):
             await update.message.reply_text(f"⚠️ SID সঠিক ফরম্যাটে নেই।", parse_mode='Markdown')
             return ConversationHandler.END
-        client = Client(sid, auth)
-        client.api.accounts(sid).fetch()
-        user_sessions[user_id] = {'sid': sid, 'auth': auth, 'number': None}
-        save_sessions()
+        client = twilio_clients.client_for(sid, auth)
+        await twilio_call(client.api.accounts(sid).fetch)
+        async with user_operations.lock(user_id):
+            previous = user_sessions.get(user_id)
+            if previous and previous.get('sid') == sid:
+                previous.update(auth=auth, validated_at=time.time())
+            else:
+                if previous:
+                    await release_sweep.record(user_id, previous)
+                    number_inventory.forget_user(user_id)
+                user_sessions[user_id] = {'sid': sid, 'auth': auth, 'number': None, 'numbers': {}, 'validated_at': time.time()}
+            twilio_clients.remember(user_id, sid, auth, client)
+            save_session(user_id)
+            # Numbers queued for release when this account logged out belong to the new session again.
+            await release_sweep.restore(user_id, sid)
         await update.message.reply_text("🎉 লগইন সফল হয়েছে!", reply_markup=reply_markup)
     except Exception as e:
         logger.error(f"Login failed for {user_id}: {e}")
@@ -210,40 +1397,49 @@ async def receive_credentials(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def logout_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if user_id in user_sessions:
+    # Wait for an in-flight purchase or release so its number is recorded before the session goes away.
+    async with user_operations.lock(user_id):
+        if user_id not in user_sessions:
+            await update.message.reply_text("ℹ️ আপনি লগইন অবস্থায় নেই।")
+            return
+        queued = await release_sweep.record(user_id, user_sessions[user_id])
+        number_inventory.forget_user(user_id)
         del user_sessions[user_id]
-        save_sessions()
-        await update.message.reply_text("✅ আপনি সফলভাবে লগ আউট হয়েছেন।")
-    else:
-        await update.message.reply_text("ℹ️ আপনি লগইন অবস্থায় নেই।")
+        twilio_clients.discard(user_id)
+        save_session(user_id)
+    text = "✅ আপনি সফলভাবে লগ আউট হয়েছেন।"
+    if queued: text += f"\n🗑️ আপনার {queued}টি নম্বর শীঘ্রই রিলিজ করা হবে। একই অ্যাকাউন্টে আবার লগইন করলে নম্বরগুলো রেখে দেওয়া হবে।"
+    await update.message.reply_text(text)
 
 @force_subscribe_check
 async def ask_for_ca_area_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    if get_twilio_client(user_id) is None:
+    if await get_twilio_client(user_id) is None:
         await update.message.reply_text(f"🔒 অনুগ্রহ করে প্রথমে '{LOGIN_TEXT}' চাপুন।")
         return ConversationHandler.END
     if user_sessions[user_id].get('number'):
         await update.message.reply_text(f"ℹ️ আপনার ইতিমধ্যেই একটি নম্বর কেনা আছে।")
         return ConversationHandler.END
-    await update.message.reply_text("📝 কানাডার ৩ সংখ্যার এরিয়া কোড দিন (e.g., 416)।\n\n/cancel দিয়ে বাতিল করুন।")
+    await update.message.reply_text(f"{search_targets_help()}\n\n/cancel দিয়ে বাতিল করুন।")
     return AWAITING_CA_AREA_CODE
 
 async def list_numbers_by_ca_area_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    area_code = update.message.text.strip()
-    if not area_code.isdigit() or len(area_code) != 3:
-        await update.message.reply_text("⚠️ সঠিক ৩ সংখ্যার এরিয়া কোড দিন।")
+    targets = parse_search_targets(update.message.text)
+    if not targets:
+        await update.message.reply_text(f"⚠️ বুঝতে পারিনি।\n{search_targets_help()}")
         return AWAITING_CA_AREA_CODE
-    client = get_twilio_client(user_id)
+    if not user_operations.allow(user_id):
+        await update.message.reply_text(SLOW_DOWN_TEXT)
+        return AWAITING_CA_AREA_CODE
+    client = await get_twilio_client(user_id)
     if not client: return ConversationHandler.END
-    try:
-        await update.message.reply_text(f"🔎 `{area_code}` এ নম্বর খোঁজা হচ্ছে...", parse_mode='Markdown')
-        numbers = client.available_phone_numbers("CA").local.list(area_code=area_code, limit=10)
-        await display_numbers_with_buy_buttons(update.message, context, numbers, f"`{area_code}` এরিয়া কোডে")
-    except Exception as e:
-        logger.error(f"Fetch numbers failed: {e}")
-        await update.message.reply_text("⚠️ নম্বর আনতে সমস্যা হয়েছে।")
+    labels = ", ".join(f"`{c}:{a}`" if c != 'CA' and a else f"`{a or c}`" for c, a in targets)
+    await update.message.reply_text(f"🔎 {labels} এ নম্বর খোঁজা হচ্ছে...", parse_mode='Markdown')
+    shown, failed = await stream_number_searches(update.message, context, client, targets)
+    if not shown:
+        if failed == len(targets): await update.message.reply_text("⚠️ নম্বর আনতে সমস্যা হয়েছে।")
+        else: await update.message.reply_text("😔 এই মুহূর্তে কোনো উপলভ্য নম্বর নেই।")
     return ConversationHandler.END
 
 async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -253,38 +1449,46 @@ async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE
 @force_subscribe_check
 async def purchase_number_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
+    if not await answer_or_throttle(query): return
     user_id = query.from_user.id
-    client = get_twilio_client(user_id)
-    if not client: return
+    await user_operations.run_once(user_id, query.data, partial(_purchase_number, context, user_id, query.data))
+
+async def _purchase_number(context: ContextTypes.DEFAULT_TYPE, user_id: int, callback_data: str) -> bool:
+    client = await get_twilio_client(user_id)
+    if not client: return False
     if user_sessions[user_id].get('number'):
-        await context.bot.send_message(chat_id=user_id, text=f"ℹ️ আপনার ইতিমধ্যেই একটি নম্বর কেনা আছে।")
-        return
+        await outbox.send(user_id, f"ℹ️ আপনার ইতিমধ্যেই একটি নম্বর কেনা আছে।")
+        return False
     try:
-        number_to_buy = query.data.replace('purchase_', '')
+        number_to_buy = callback_data.replace('purchase_', '')
         if not number_to_buy.startswith('+'): raise ValueError("Invalid format")
     except (ValueError, IndexError):
-        await context.bot.send_message(chat_id=user_id, text="⚠️ অনুরোধে ত্রুটি হয়েছে।")
-        return
-    msg = await context.bot.send_message(chat_id=user_id, text=f"⏳ `{number_to_buy}` কেনা হচ্ছে...", parse_mode='Markdown')
+        await outbox.send(user_id, "⚠️ অনুরোধে ত্রুটি হয়েছে।")
+        return False
+    msg = await outbox.send(user_id, f"⏳ `{number_to_buy}` কেনা হচ্ছে...", parse_mode='Markdown')
     try:
-        number = client.incoming_phone_numbers.create(phone_number=number_to_buy)
-        user_sessions[user_id]['number'] = number.phone_number
-        save_sessions()
+        number = await _provision_twilio_number(user_id, client, number_to_buy)
         await msg.edit_text(f"🛍️ নম্বর `{number.phone_number}` সফলভাবে কেনা হয়েছে!", parse_mode='Markdown')
+        return True
     except Exception as e:
         await msg.delete()
         logger.error(f"Buy failed for {user_id}: {e}")
         error = f"❌ এই নম্বরটি (`{number_to_buy}`) কিনতে সমস্যা হয়েছে।"
         if "already provisioned" in str(e).lower(): error += " এটি আপনার অ্যাকাউন্টে আছে।"
-        elif "not available" in str(e).lower(): error += " এটি আর উপলব্ধ নেই।"
+        elif "not available" in str(e).lower():
+            error += " এটি আর উপলব্ধ নেই।"
+            number_search_cache.evict_number(number_to_buy)
         elif "balance" in str(e).lower(): error += " আপনার অ্যাকাউন্টে পর্যাপ্ত ব্যালেন্স নেই।"
-        await context.bot.send_message(chat_id=user_id, text=error, parse_mode='Markdown')
+        await outbox.send(user_id, error, parse_mode='Markdown')
+        return False
 
 @force_subscribe_check
 async def show_messages_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    client = get_twilio_client(user_id)
+    if not user_operations.allow(user_id):
+        await update.message.reply_text(SLOW_DOWN_TEXT)
+        return
+    client = await get_twilio_client(user_id)
     if not client:
         await update.message.reply_text(f"🔒 '{LOGIN_TEXT}' ব্যবহার করে লগইন করুন।")
         return
@@ -294,40 +1498,69 @@ async def show_messages_handler(update: Update, context: ContextTypes.DEFAULT_TY
         return
     try:
         msg = await update.message.reply_text(f"📨 `{number}` এর মেসেজ খোঁজা হচ্ছে...", parse_mode='Markdown')
-        messages = client.messages.list(to=number, limit=5)
+        entries, has_more = await message_cache.latest(client, number)
         await msg.delete()
-        keyboard = [[InlineKeyboardButton("🗑️ এই নম্বরটা রিমুভ করুন", callback_data=DIRECT_REMOVE_AFTER_SHOW_MSG_CALLBACK)]]
-        markup = InlineKeyboardMarkup(keyboard)
-        if not messages:
-            await update.message.reply_text("📪 এই নম্বরে কোনো নতুন মেসেজ নেই।", reply_markup=markup)
-        else:
-            parts = [f"📨 আপনার নম্বর (`{number}`) এ আসা মেসেজ:\n"]
-            for m in messages:
-                body = format_codes_in_message(m.body or "")
-                parts.append(f"\n➡️ **From:** `{m.from_}`\n📝 **Msg:** {body}\n---")
-            await update.message.reply_text("".join(parts), reply_markup=markup, parse_mode='Markdown')
+        text, markup = render_messages_page(number, entries, 0, has_more)
+        await update.message.reply_text(text, reply_markup=markup, parse_mode='Markdown' if entries else None)
     except Exception as e:
         logger.error(f"Show messages failed: {e}")
         await update.message.reply_text("⚠️ মেসেজ আনতে সমস্যা হয়েছে।")
 
+def render_messages_page(number: str, entries: list[dict], offset: int, has_more: bool) -> tuple[str, InlineKeyboardMarkup]:
+    keyboard = [[InlineKeyboardButton("⏪ পুরনো মেসেজ", callback_data=f"{OLDER_MESSAGES_CALLBACK_PREFIX}{offset + MESSAGE_PAGE_SIZE}")]] if has_more and entries else []
+    keyboard.append([InlineKeyboardButton("🗑️ এই নম্বরটা রিমুভ করুন", callback_data=DIRECT_REMOVE_AFTER_SHOW_MSG_CALLBACK)])
+    markup = InlineKeyboardMarkup(keyboard)
+    if not entries:
+        return ("📪 এই নম্বরে কোনো নতুন মেসেজ নেই।" if offset == 0 else "📪 এর চেয়ে পুরনো কোনো মেসেজ নেই।"), markup
+    if offset == 0: parts = [f"📨 আপনার নম্বর (`{number}`) এ আসা মেসেজ:\n"]
+    else: parts = [f"📨 আপনার নম্বর (`{number}`) এ আসা পুরনো মেসেজ ({offset + 1}-{offset + len(entries)}):\n"]
+    for entry in entries:
+        parts.append(f"\n➡️ **From:** `{entry['from']}`\n📝 **Msg:** {entry['body']}\n---")
+    if not has_more and offset + MESSAGE_PAGE_SIZE >= MESSAGE_CACHE_PER_NUMBER:
+        parts.append(f"\n\nℹ️ এখানে শুধু সর্বশেষ {MESSAGE_CACHE_PER_NUMBER}টি মেসেজ দেখা যায়।")
+    return "".join(parts), markup
+
+@force_subscribe_check
+async def older_messages_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if not await answer_or_throttle(query): return
+    user_id = query.from_user.id
+    client = await get_twilio_client(user_id)
+    number = user_sessions[user_id].get('number') if client else None
+    if not number:
+        await query.message.reply_text("🚫 কোনো সক্রিয় নম্বর নেই।")
+        return
+    try:
+        offset = int(query.data[len(OLDER_MESSAGES_CALLBACK_PREFIX):])
+        entries, has_more = await message_cache.page(client, number, offset)
+        text, markup = render_messages_page(number, entries, offset, has_more)
+        await query.message.reply_text(text, reply_markup=markup, parse_mode='Markdown' if entries else None)
+    except Exception as e:
+        logger.error(f"Older messages failed: {e}")
+        await query.message.reply_text("⚠️ মেসেজ আনতে সমস্যা হয়েছে।")
+
 @force_subscribe_check
 async def direct_remove_after_show_msg_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
+    if not await answer_or_throttle(query): return
     user_id = query.from_user.id
-    client = get_twilio_client(user_id)
+    await user_operations.run_once(user_id, (query.data, query.message.message_id), partial(_remove_active_number, query, user_id, "🚫 কোনো সক্রিয় নম্বর নেই।"))
+
+async def _remove_active_number(query, user_id: int, no_number_text: str) -> bool:
+    client = await get_twilio_client(user_id)
     if not client or not user_sessions[user_id].get('number'):
-        await query.edit_message_text(text="🚫 কোনো সক্রিয় নম্বর নেই।")
-        return
+        await query.edit_message_text(text=no_number_text)
+        return False
     number = user_sessions[user_id]['number']
     await query.edit_message_text(f"⏳ `{number}` রিমুভ করা হচ্ছে...", parse_mode='Markdown')
     success, message = await _release_twilio_number(user_id, client, number)
     await query.edit_message_text(message, parse_mode='Markdown')
+    return success
 
 @force_subscribe_check
 async def remove_number_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    if get_twilio_client(user_id) is None:
+    if await get_twilio_client(user_id) is None:
         await update.message.reply_text(f"🔒 '{LOGIN_TEXT}' ব্যবহার করে লগইন করুন।")
         return
     number = user_sessions[user_id].get('number')
@@ -340,19 +1573,12 @@ async def remove_number_handler(update: Update, context: ContextTypes.DEFAULT_TY
 @force_subscribe_check
 async def confirm_remove_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
+    if not await answer_or_throttle(query): return
     user_id = query.from_user.id
     if query.data == CONFIRM_REMOVE_NO_CALLBACK:
         await query.edit_message_text("🚫 রিমুভ বাতিল করা হয়েছে।")
         return
-    client = get_twilio_client(user_id)
-    if not client or not user_sessions[user_id].get('number'):
-        await query.edit_message_text("🚫 অনুরোধটি আর বৈধ নয়।")
-        return
-    number = user_sessions[user_id]['number']
-    await query.edit_message_text(f"⏳ `{number}` রিমুভ করা হচ্ছে...", parse_mode='Markdown')
-    success, message = await _release_twilio_number(user_id, client, number)
-    await query.edit_message_text(message, parse_mode='Markdown')
+    await user_operations.run_once(user_id, (query.data, query.message.message_id), partial(_remove_active_number, query, user_id, "🚫 অনুরোধটি আর বৈধ নয়।"))
 
 async def handle_general_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.strip()
@@ -364,16 +1590,137 @@ async def support_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [[InlineKeyboardButton(f"💬 অ্যাডমিনের সাথে যোগাযোগ", url=f"https://t.me/MrGhosh75")]]
     await update.message.reply_text("সাপোর্টের জন্য, অ্যাডমিনের সাথে যোগাযোগ করুন:", reply_markup=InlineKeyboardMarkup(keyboard))
 
-# --- Main block to run the bot ---
-if __name__ == '__main__':
-    TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
-    if TOKEN is None:
-        logger.critical("FATAL: TELEGRAM_BOT_TOKEN not set!")
-        exit()
-    
-    load_sessions()
-    
-    app = Application.builder().token(TOKEN).build()
+@force_subscribe_check
+async def bulk_buy_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    client = await get_twilio_client(user_id)
+    if client is None:
+        await update.message.reply_text(f"🔒 '{LOGIN_TEXT}' ব্যবহার করে লগইন করুন।")
+        return
+    if not user_operations.allow(user_id):
+        await update.message.reply_text(SLOW_DOWN_TEXT)
+        return
+    args = context.args
+    if args and all(arg.startswith('+') for arg in args):
+        numbers = list(dict.fromkeys(args))
+    elif len(args) >= 2 and args[0].isdigit() and (targets := parse_search_targets(" ".join(args[1:]))):
+        results = await asyncio.gather(*(number_search_cache.search(client, c, a) for c, a in targets), return_exceptions=True)
+        found = [n.phone_number for result in results if not isinstance(result, Exception) for n in result]
+        numbers = list(dict.fromkeys(found))[:int(args[0])]
+    else:
+        await update.message.reply_text(f"ℹ️ ব্যবহার: /bulkbuy <সংখ্যা> <এরিয়া কোড...> অথবা /bulkbuy +1... +1...\nসর্বোচ্চ {BULK_MAX_ITEMS}টি নম্বর।")
+        return
+    if not numbers:
+        await update.message.reply_text("😔 এই মুহূর্তে কোনো উপলভ্য নম্বর নেই।")
+        return
+    numbers = numbers[:BULK_MAX_ITEMS]
+    progress = await update.message.reply_text(f"⏳ {len(numbers)}টি নম্বর কেনা হচ্ছে...")
+    async with user_operations.lock(user_id):
+        if user_id not in user_sessions:
+            await progress.edit_text(f"🔒 '{LOGIN_TEXT}' ব্যবহার করে লগইন করুন।")
+            return
+        await bulk_buy(user_id, client, numbers, progress)
+
+@force_subscribe_check
+async def bulk_release_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    client = await get_twilio_client(user_id)
+    if client is None:
+        await update.message.reply_text(f"🔒 '{LOGIN_TEXT}' ব্যবহার করে লগইন করুন।")
+        return
+    if not user_operations.allow(user_id):
+        await update.message.reply_text(SLOW_DOWN_TEXT)
+        return
+    owned = number_inventory.numbers_for(user_id)
+    numbers = [n for n in dict.fromkeys(context.args) if n in owned] if context.args else list(owned)
+    if not numbers:
+        await update.message.reply_text("ℹ️ আপনার রিমুভ করার মতো কোনো নম্বর নেই।")
+        return
+    numbers = numbers[:BULK_MAX_ITEMS]
+    progress = await update.message.reply_text(f"⏳ {len(numbers)}টি নম্বর রিমুভ করা হচ্ছে...")
+    async with user_operations.lock(user_id):
+        if user_id not in user_sessions:
+            await progress.edit_text(f"🔒 '{LOGIN_TEXT}' ব্যবহার করে লগইন করুন।")
+            return
+        await bulk_release(user_id, client, numbers, progress)
+
+async def sweep_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_IDS: return
+    if not release_sweep.accounts:
+        await update.message.reply_text("ℹ️ রিলিজ করার মতো কোনো নম্বর বাকি নেই।")
+        return
+    progress = await update.message.reply_text(f"⏳ লগ আউট করা অ্যাকাউন্টের {release_sweep.pending()}টি নম্বর রিলিজ করা হচ্ছে...")
+    await release_sweep.sweep(progress)
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global active_broadcast
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS: return
+    parts = update.message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await update.message.reply_text("ℹ️ ব্যবহার: /broadcast <মেসেজ>")
+        return
+    if active_broadcast is not None and not active_broadcast.done():
+        await update.message.reply_text("⏳ আরেকটি ব্রডকাস্ট এখনও চলছে।")
+        return
+    state, targets = {'id': uuid.uuid4().hex, 'text': parts[1], 'admin_id': user_id, 'offset': 0, 'sent': 0, 'failed': 0}, list(user_sessions)
+    await save_broadcast_state(state, targets)
+    active_broadcast = asyncio.create_task(run_broadcast(state, targets))
+    background_tasks.append(active_broadcast)
+    await update.message.reply_text(f"📣 {len(targets)} জন ইউজারকে ব্রডকাস্ট শুরু হয়েছে।")
+
+# --- Application lifecycle ---
+async def on_startup(application: Application):
+    global telegram_bot, bot_loop, active_broadcast
+    telegram_bot, bot_loop = application.bot, asyncio.get_running_loop()
+    background_tasks.append(asyncio.create_task(session_flusher()))
+    if NUMBER_WARMER_INTERVAL > 0: background_tasks.append(asyncio.create_task(number_search_warmer()))
+    if NUMBER_RECONCILE_INTERVAL > 0: background_tasks.append(asyncio.create_task(reconcile_number_inventory()))
+    outbox.start(application.bot)
+    release_sweep.load()
+    if RELEASE_SWEEP_INTERVAL > 0: background_tasks.append(asyncio.create_task(periodic_release_sweep()))
+    resumable = load_broadcast_state()
+    if resumable:
+        state, targets = resumable
+        logger.info(f"Resuming broadcast {state['id']} with {len(targets) - state['offset']} users left.")
+        active_broadcast = asyncio.create_task(run_broadcast(state, targets))
+        background_tasks.append(active_broadcast)
+
+async def on_shutdown(application: Application):
+    await outbox.stop()
+    for task in background_tasks: task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    close_sessions()
+
+# --- Handler graph ---
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    # ConversationHandler needs each user's updates handled in order (e.g. "Login" then the credentials arriving in
+    # one backlog); updates from different users still run concurrently up to CONCURRENT_UPDATES.
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            await coroutine
+            return
+        lock = self._locks.get(user.id)
+        if lock is None: self._locks[user.id] = lock = asyncio.Lock()
+        async with lock:
+            await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+def build_application(token: str, base_url: str | None = None) -> Application:
+    builder = Application.builder().token(token).request(InstrumentedRequest(connection_pool_size=TELEGRAM_POOL_SIZE)).concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES)).post_init(on_startup).post_shutdown(on_shutdown)
+    if base_url: builder = builder.base_url(base_url)
+    app = builder.build()
 
     login_conv = ConversationHandler(entry_points=[MessageHandler(filters.Regex(f'^{LOGIN_TEXT}$'), login_command_handler)], states={AWAITING_CREDENTIALS: [MessageHandler(filters.TEXT & ~filters.COMMAND, receive_credentials)]}, fallbacks=[CommandHandler('cancel', cancel_conversation)])
     buy_conv = ConversationHandler(entry_points=[MessageHandler(filters.Regex(f'^{BUY_TEXT}$'), ask_for_ca_area_code)], states={AWAITING_CA_AREA_CODE: [MessageHandler(filters.TEXT & ~filters.COMMAND, list_numbers_by_ca_area_code)]}, fallbacks=[CommandHandler('cancel', cancel_conversation)])
@@ -382,6 +1729,10 @@ if __name__ == '__main__':
     app.add_handler(buy_conv)
     
     app.add_handler(CommandHandler("start", start))
+    app.add_handler(CommandHandler("broadcast", broadcast_command))
+    app.add_handler(CommandHandler("bulkbuy", bulk_buy_command))
+    app.add_handler(CommandHandler("bulkrelease", bulk_release_command))
+    app.add_handler(CommandHandler("sweep", sweep_command))
     app.add_handler(MessageHandler(filters.Regex(f'^{START_COMMAND_TEXT}$'), start))
     app.add_handler(MessageHandler(filters.Regex(f'^{LOGOUT_TEXT}$'), logout_handler))
     app.add_handler(MessageHandler(filters.Regex(f'^{REMOVE_NUMBER_TEXT}$'), remove_number_handler))
@@ -391,11 +1742,33 @@ if __name__ == '__main__':
     app.add_handler(CallbackQueryHandler(purchase_number_callback_handler, pattern=f'^{PURCHASE_CALLBACK_PREFIX}'))
     app.add_handler(CallbackQueryHandler(confirm_remove_callback_handler, pattern=f'^{CONFIRM_REMOVE_YES_CALLBACK}$|^{CONFIRM_REMOVE_NO_CALLBACK}$'))
     app.add_handler(CallbackQueryHandler(direct_remove_after_show_msg_callback, pattern=f'^{DIRECT_REMOVE_AFTER_SHOW_MSG_CALLBACK}$'))
+    app.add_handler(CallbackQueryHandler(older_messages_callback, pattern=f'^{OLDER_MESSAGES_CALLBACK_PREFIX}\\d+$'))
     
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_general_text))
+    app.add_handler(ChatMemberHandler(track_channel_membership, ChatMemberHandler.CHAT_MEMBER))
+    instrument_handlers(app)
+    return app
+
+# --- Main block to run the bot ---
+if __name__ == '__main__':
+    TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+    if TOKEN is None:
+        logger.critical("FATAL: TELEGRAM_BOT_TOKEN not set!")
+        exit()
+    
+    load_sessions()
+    
+    app = build_application(TOKEN)
 
-    # Run Flask in a separate thread
-    threading.Thread(target=run_flask, daemon=True).start()
+    if BOT_MODE == 'webhook':
+        if not PUBLIC_BASE_URL:
+            logger.critical("FATAL: BOT_MODE=webhook needs PUBLIC_BASE_URL!")
+            exit()
+        logger.info("🤖 Bot is starting (webhook mode)...")
+        asyncio.run(run_webhook(app))
+    else:
+        # Run Flask in a separate thread
+        threading.Thread(target=run_flask, daemon=True).start()
 
-    logger.info("🤖 Bot is starting...")
-    app.run_polling()
+        logger.info("🤖 Bot is starting...")
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
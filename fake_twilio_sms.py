@@ -0,0 +1,33 @@
+# fake_twilio_sms.py
+# Sends a signed, Twilio-style inbound SMS webhook to a locally running bot.
+#   python fake_twilio_sms.py --account-sid AC... --auth-token ... --to +14165550123 --body "Your code is 123456"
+# If the bot runs with PUBLIC_BASE_URL, pass --sign-url with that public URL so the signature matches.
+
+import argparse
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+from twilio.request_validator import RequestValidator
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="POST a fake inbound SMS to the bot's Twilio webhook")
+    parser.add_argument('--url', default=f"http://127.0.0.1:{os.environ.get('PORT', 8080)}/twilio/sms")
+    parser.add_argument('--sign-url', help="URL the bot validates against (defaults to --url)")
+    parser.add_argument('--account-sid', required=True)
+    parser.add_argument('--auth-token', required=True)
+    parser.add_argument('--to', required=True)
+    parser.add_argument('--from', dest='from_', default='+15005550006')
+    parser.add_argument('--body', default='Your verification code is 123456')
+    args = parser.parse_args()
+
+    params = {'MessageSid': f"SM{uuid.uuid4().hex}", 'AccountSid': args.account_sid, 'From': args.from_, 'To': args.to, 'Body': args.body, 'NumMedia': '0'}
+    signature = RequestValidator(args.auth_token).compute_signature(args.sign_url or args.url, params)
+    req = urllib.request.Request(args.url, data=urllib.parse.urlencode(params).encode(), headers={'X-Twilio-Signature': signature})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            print(resp.status, resp.read().decode())
+    except urllib.error.HTTPError as e:
+        print(e.code, e.read().decode())
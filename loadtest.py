@@ -0,0 +1,257 @@
+# loadtest.py
+# Offline load test: drives the real handler graph from bot.build_application() with synthetic updates while
+# local stand-in servers play the Telegram Bot API and the Twilio REST API. No network access is needed.
+#   python loadtest.py --concurrency 1,10,50,100 --twilio-latency-ms 80 --telegram-latency-ms 20
+#   python loadtest.py --concurrency 50 --max-p99-ms 1500 --min-ups 100   (exits non-zero when a gate fails)
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+os.environ.update({'SESSION_BACKEND': 'sqlite', 'PUBLIC_BASE_URL': '', 'NO_PROXY': '127.0.0.1,localhost', 'no_proxy': '127.0.0.1,localhost'})
+os.environ.setdefault('USER_RATE_LIMIT', '1000')  # virtual users act far faster than humans; override to test throttling
+os.environ.setdefault('USER_RATE_BURST', '1000')
+
+import bot
+from telegram import Update
+
+TOKEN = '123456:LOADTEST'
+TWILIO_API = 'https://api.twilio.com'
+
+class Backend:
+    def __init__(self, latency_ms: float, error_rate: float):
+        self.latency, self.error_rate = latency_ms / 1000, error_rate
+        self.lock = threading.Lock()
+
+    def delay_and_fail(self) -> bool:
+        if self.latency: time.sleep(random.uniform(0.5, 1.5) * self.latency)
+        return random.random() < self.error_rate
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    backend: Backend = None
+
+    def log_message(self, *args): pass
+
+    def _body(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return {k: v[-1] for k, v in parse_qs(self.rfile.read(length).decode()).items()} if length else {}
+
+    def _reply(self, status: int, payload=None):
+        data = b'' if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+# --- Fake Telegram Bot API ---
+class TelegramStub(StubHandler):
+    message_ids = iter(range(1, 1 << 62))
+    keyboards: dict[int, list[str]] = {}
+
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        params = self._body()
+        if self.backend.delay_and_fail():
+            return self._reply(500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error: injected'})
+        self._reply(200, {'ok': True, 'result': self.result_for(method, params)})
+
+    do_GET = do_POST
+
+    def result_for(self, method: str, params: dict):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'LoadBot', 'username': 'load_bot', 'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+        if method == 'getChatMember':
+            return {'status': 'member', 'user': {'id': int(params.get('user_id', 0)), 'is_bot': False, 'first_name': 'user'}}
+        if method == 'getChat':
+            return {'id': int(params.get('chat_id', 0)), 'type': 'channel', 'title': 'Load Test Channel'}
+        if method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params.get('chat_id') or 0)
+            markup = json.loads(params.get('reply_markup') or '{}')
+            buttons = [b['callback_data'] for row in markup.get('inline_keyboard', []) for b in row if 'callback_data' in b]
+            if buttons and chat_id:
+                with self.backend.lock: self.keyboards[chat_id] = buttons
+            if method == 'editMessageText' and not chat_id: return True
+            return {'message_id': next(self.message_ids), 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+        return True
+
+# --- Fake Twilio REST API ---
+ACCOUNT_PATH = re.compile(r'^/2010-04-01/Accounts/(?P<sid>AC\w+)(?P<rest>.*)$')
+
+class TwilioStub(StubHandler):
+    owned: dict[str, dict] = {}
+
+    def _route(self, verb: str):
+        url = urlparse(self.path)
+        match = ACCOUNT_PATH.match(url.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self._body() if verb == 'POST' else {}
+        if self.backend.delay_and_fail():
+            return self._reply(500, {'code': 20500, 'message': 'Internal Server Error: injected', 'more_info': '', 'status': 500})
+        if not match: return self._reply(404, {'code': 20404, 'message': 'Not found', 'more_info': '', 'status': 404})
+        sid, rest = match['sid'], match['rest']
+        if rest == '.json':
+            return self._reply(200, {'sid': sid, 'status': 'active', 'friendly_name': 'load test'})
+        local = re.match(r'^/AvailablePhoneNumbers/(\w+)/Local\.json$', rest)
+        if local:
+            area = params.get('AreaCode') or '416'
+            numbers = [{'phone_number': f"+1{area}{random.randint(0, 9999999):07d}", 'iso_country': local[1], 'capabilities': {'voice': True, 'SMS': True, 'MMS': True}} for _ in range(int(params.get('PageSize', 10)))]
+            return self._reply(200, {'available_phone_numbers': numbers, 'uri': url.path})
+        if rest == '/IncomingPhoneNumbers.json' and verb == 'POST':
+            record = {'sid': f"PN{uuid.uuid4().hex}", 'account_sid': sid, 'phone_number': body.get('PhoneNumber'), 'capabilities': {'voice': True, 'sms': True, 'mms': True}, 'date_created': formatdate(usegmt=True)}
+            with self.backend.lock: self.owned[record['sid']] = record
+            return self._reply(201, record)
+        if rest == '/IncomingPhoneNumbers.json':
+            with self.backend.lock: found = [r for r in self.owned.values() if r['account_sid'] == sid and r['phone_number'] == params.get('PhoneNumber', r['phone_number'])]
+            return self._reply(200, {'incoming_phone_numbers': found, 'next_page_uri': None})
+        owned = re.match(r'^/IncomingPhoneNumbers/(PN\w+)\.json$', rest)
+        if owned and verb == 'DELETE':
+            with self.backend.lock: existed = self.owned.pop(owned[1], None)
+            return self._reply(204) if existed else self._reply(404, {'code': 20404, 'message': 'Not found', 'more_info': '', 'status': 404})
+        if rest == '/Messages.json':
+            now = time.time()
+            messages = [{'sid': f"SM{uuid.uuid4().hex}", 'account_sid': sid, 'to': params.get('To'), 'from': '+15005550006', 'body': f"Your verification code is {random.randint(100000, 999999)}", 'direction': 'inbound', 'status': 'received', 'date_sent': formatdate(now - i * 60, usegmt=True)} for i in range(3)]
+            return self._reply(200, {'messages': messages, 'next_page_uri': None})
+        return self._reply(404, {'code': 20404, 'message': 'Not found', 'more_info': '', 'status': 404})
+
+    def do_GET(self): self._route('GET')
+    def do_POST(self): self._route('POST')
+    def do_DELETE(self): self._route('DELETE')
+
+def start_stub(handler_cls, backend: Backend) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), type(handler_cls.__name__, (handler_cls,), {'backend': backend}))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class LocalTwilioHttpClient(bot.PooledTwilioHttpClient):
+    def __init__(self, base_url: str):
+        super().__init__(bot.TWILIO_POOL_MAXSIZE, bot.TWILIO_CALL_TIMEOUT)
+        self.base_url = base_url
+
+    def request(self, method, url, *args, **kwargs):
+        return super().request(method, url.replace(TWILIO_API, self.base_url, 1), *args, **kwargs)
+
+# --- Synthetic updates ---
+class VirtualUser:
+    update_ids = iter(range(1, 1 << 62))
+
+    def __init__(self, app, user_id: int, samples: list):
+        self.app, self.user_id, self.samples = app, user_id, samples
+        self.user = {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+        self.chat = {'id': user_id, 'type': 'private'}
+
+    async def _process(self, step: str, payload: dict):
+        update = Update.de_json({'update_id': next(self.update_ids), **payload}, self.app.bot)
+        started = time.perf_counter()
+        await self.app.process_update(update)
+        self.samples.append((step, time.perf_counter() - started))
+
+    async def text(self, step: str, text: str):
+        message = {'message_id': next(self.update_ids), 'date': int(time.time()), 'chat': self.chat, 'from': self.user, 'text': text}
+        await self._process(step, {'message': message})
+
+    async def press(self, step: str, data: str):
+        message = {'message_id': next(self.update_ids), 'date': int(time.time()), 'chat': self.chat, 'from': {'id': 1, 'is_bot': True, 'first_name': 'LoadBot'}, 'text': '...'}
+        await self._process(step, {'callback_query': {'id': str(next(self.update_ids)), 'from': self.user, 'chat_instance': str(self.user_id), 'data': data, 'message': message}})
+
+    async def run(self, iterations: int):
+        await self.text('login', bot.LOGIN_TEXT)
+        await self.text('login_credentials', f"AC{uuid.uuid4().hex} {uuid.uuid4().hex}")
+        for _ in range(iterations):
+            await self.text('buy', bot.BUY_TEXT)
+            await self.text('buy_area_code', random.choice(['416', '647', '416, 647', 'toronto']))
+            buttons = [b for b in TelegramStub.keyboards.get(self.user_id, []) if b.startswith(bot.PURCHASE_CALLBACK_PREFIX)]
+            if buttons: await self.press('buy_purchase', random.choice(buttons))
+            await self.text('show_messages', bot.SHOW_MESSAGES_TEXT)
+            await self.text('remove', bot.REMOVE_NUMBER_TEXT)
+            await self.press('remove_confirm', bot.CONFIRM_REMOVE_YES_CALLBACK)
+        await self.text('logout', bot.LOGOUT_TEXT)
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+async def run_level(app, concurrency: int, iterations: int, first_user_id: int) -> dict:
+    samples: list = []
+    users = [VirtualUser(app, first_user_id + i, samples) for i in range(concurrency)]
+    started = time.perf_counter()
+    await asyncio.gather(*(user.run(iterations) for user in users))
+    elapsed = time.perf_counter() - started
+    latencies = [seconds for _, seconds in samples]
+    by_step: dict[str, list[float]] = {}
+    for step, seconds in samples: by_step.setdefault(step, []).append(seconds)
+    return {'concurrency': concurrency, 'updates': len(samples), 'elapsed': elapsed, 'ups': len(samples) / elapsed if elapsed else 0.0,
+            'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'p99': percentile(latencies, 99),
+            'steps': {step: percentile(values, 95) for step, values in by_step.items()}}
+
+async def main(args) -> int:
+    # The bot writes its session DB, sweep/broadcast state and bulk reports relative to the working directory.
+    tmp_dir, cwd = tempfile.mkdtemp(prefix='bot-loadtest-'), os.getcwd()
+    os.chdir(tmp_dir)
+    bot.SESSIONS_DB = os.path.join(tmp_dir, 'sessions.db')
+    try:
+        return await run_load_test(args)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+async def run_load_test(args) -> int:
+    telegram = start_stub(TelegramStub, Backend(args.telegram_latency_ms, args.telegram_error_rate))
+    twilio = start_stub(TwilioStub, Backend(args.twilio_latency_ms, args.twilio_error_rate))
+    bot.twilio_clients.http_client = LocalTwilioHttpClient(f"http://127.0.0.1:{twilio.server_port}")
+    bot.load_sessions()
+    app = bot.build_application(TOKEN, base_url=f"http://127.0.0.1:{telegram.server_port}/bot")
+    results = []
+    async with app:
+        await bot.on_startup(app)
+        try:
+            for index, concurrency in enumerate(args.concurrency):
+                result = await run_level(app, concurrency, args.iterations, first_user_id=1_000_000 * (index + 1))
+                results.append(result)
+                print(f"{result['concurrency']:>6} users  {result['updates']:>7} updates  {result['ups']:>8.1f} upd/s  "
+                      f"p50 {result['p50'] * 1000:>7.1f} ms  p95 {result['p95'] * 1000:>7.1f} ms  p99 {result['p99'] * 1000:>7.1f} ms", flush=True)
+                if args.verbose:
+                    for step, p95 in sorted(result['steps'].items()): print(f"         {step:<18} p95 {p95 * 1000:>7.1f} ms")
+        finally:
+            await bot.on_shutdown(app)
+    errors = sum(bot.metrics.errors.values())
+    if errors: print(f"errors recorded: {dict(bot.metrics.errors)}")
+    if args.json: print(json.dumps(results))
+    last = results[-1]
+    failed = []
+    if args.max_p99_ms is not None and last['p99'] * 1000 > args.max_p99_ms: failed.append(f"p99 {last['p99'] * 1000:.1f} ms > {args.max_p99_ms} ms")
+    if args.min_ups is not None and last['ups'] < args.min_ups: failed.append(f"{last['ups']:.1f} upd/s < {args.min_ups} upd/s")
+    for reason in failed: print(f"GATE FAILED: {reason}")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline load test for bot.py")
+    parser.add_argument('--concurrency', type=lambda v: [int(x) for x in v.split(',')], default=[1, 10, 50, 100])
+    parser.add_argument('--iterations', type=int, default=2, help="buy/show/remove cycles per virtual user")
+    parser.add_argument('--twilio-latency-ms', type=float, default=80)
+    parser.add_argument('--twilio-error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-latency-ms', type=float, default=20)
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0)
+    parser.add_argument('--max-p99-ms', type=float)
+    parser.add_argument('--min-ups', type=float)
+    parser.add_argument('--json', action='store_true', help="also print the results as JSON")
+    parser.add_argument('--verbose', action='store_true', help="print per-step p95 latency")
+    parser.add_argument('--log', action='store_true', help="keep bot/httpx/twilio logging on")
+    args = parser.parse_args()
+    if not args.log: logging.disable(logging.CRITICAL)
+    sys.exit(asyncio.run(main(args)))